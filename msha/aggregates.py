@@ -0,0 +1,159 @@
+"""
+Quarterly aggregates which can be updated incrementally.
+"""
+import pickle
+from pathlib import Path
+
+import pandas as pd
+
+from msha.constants import NON_INJURY_DEGREES
+
+# columns of the per-mine partial sums, reports is the number of production
+# rows with hours and employees (used to count active mines)
+PARTIAL_COLUMNS = [
+    "injuries",
+    "employee_count",
+    "hours_worked",
+    "coal_production",
+    "reports",
+]
+
+TOTAL_COLUMNS = [
+    "injuries",
+    "employee_count",
+    "hours_worked",
+    "coal_production",
+    "active_mine_count",
+]
+
+
+def aggregate_mine_quarters(accident_df=None, prod_df=None, freq="q"):
+    """
+    Aggregate accidents and production into partial sums for each mine and quarter.
+
+    The filters match aggregate_injuries and create_normalizer_df; accidents
+    which caused no injuries and production rows without hours worked or
+    employees are dropped.
+
+    Returns
+    -------
+    A dataframe indexed by (date, mine_id) with PARTIAL_COLUMNS.
+    """
+    grouper = pd.Grouper(key="date", freq=freq)
+    parts = []
+    if accident_df is not None:
+        is_injury = ~accident_df["degree_injury"].isin(NON_INJURY_DEGREES)
+        injuries = accident_df[is_injury].groupby([grouper, "mine_id"]).size()
+        parts.append(injuries.to_frame("injuries"))
+    if prod_df is not None:
+        has_hours = prod_df["hours_worked"] > 0
+        has_employees = prod_df["employee_count"] > 0
+        gb = prod_df[has_hours & has_employees].groupby([grouper, "mine_id"])
+        cols = ["employee_count", "hours_worked", "coal_production"]
+        parts.append(gb[cols].sum().assign(reports=gb.size()))
+    if not parts:
+        index = pd.MultiIndex.from_tuples([], names=["date", "mine_id"])
+        return pd.DataFrame(columns=PARTIAL_COLUMNS, index=index, dtype=float)
+    out = pd.concat(parts, axis=1).reindex(columns=PARTIAL_COLUMNS)
+    return out.fillna(0)
+
+
+def _get_quarter_totals(partial):
+    """Get the totals of one quarter from its per-mine partial sums."""
+    out = partial[TOTAL_COLUMNS[:-1]].sum()
+    out["active_mine_count"] = (partial["reports"] > 0).sum()
+    return out
+
+
+class QuarterlyAggregates:
+    """
+    Quarterly injury counts, hours, employees and active mines.
+
+    Partial sums are kept for each mine in each quarter so new accident or
+    production rows only recompute the quarters they fall in. The aggregates
+    are persisted as one file per quarter so saving only writes the quarters
+    which changed.
+
+    Parameters
+    ----------
+    freq
+        The frequency used for grouping, quarterly by default.
+    """
+
+    _totals_name = "totals.pkl"
+
+    def __init__(self, freq="q"):
+        self.freq = freq
+        self.partials = {}
+        self.totals = pd.DataFrame(columns=TOTAL_COLUMNS, dtype=float)
+        self._dirty = set()
+
+    @classmethod
+    def from_frames(cls, accident_df=None, prod_df=None, freq="q"):
+        """Create the aggregates from the full accident/production history."""
+        out = cls(freq=freq)
+        out.update(accident_df=accident_df, prod_df=prod_df)
+        return out
+
+    def update(self, accident_df=None, prod_df=None):
+        """
+        Add new accident and/or production rows to the aggregates.
+
+        Rows must not have been added before, else they are counted twice.
+
+        Returns
+        -------
+        A sorted DatetimeIndex of the quarters which were recomputed.
+        """
+        new = aggregate_mine_quarters(accident_df, prod_df, freq=self.freq)
+        touched = new.index.get_level_values("date").unique().sort_values()
+        rows = {}
+        for quarter, partial in new.groupby(level="date"):
+            partial = partial.droplevel("date")
+            if quarter in self.partials:
+                partial = self.partials[quarter].add(partial, fill_value=0)
+            self.partials[quarter] = partial
+            rows[quarter] = _get_quarter_totals(partial)
+        if rows:
+            new_totals = pd.DataFrame.from_dict(rows, orient="index")
+            old_totals = self.totals.drop(index=touched, errors="ignore")
+            self.totals = pd.concat([old_totals, new_totals]).sort_index()
+            self.totals.index.name = "date"
+        self._dirty |= set(touched)
+        return touched
+
+    def normalize_injuries(self):
+        """
+        Return the injuries normalized by each column, as in normalize_injuries.
+
+        As there, quarters without production (eg a new quarter whose
+        accidents arrived first) or without injuries are null.
+        """
+        norm = self.totals.drop(columns="injuries").assign(no_normalization=1)
+        norm = norm.where(self.totals["active_mine_count"] > 0)
+        injuries = self.totals["injuries"].where(self.totals["injuries"] > 0)
+        return norm.rdiv(injuries, axis=0)
+
+    def save(self, path):
+        """Save the aggregates to a directory, writing only changed quarters."""
+        path = Path(path)
+        path.mkdir(exist_ok=True, parents=True)
+        for quarter in sorted(self._dirty):
+            quarter_path = path / f"{quarter:%Y-%m-%d}.pkl"
+            self.partials[quarter].to_pickle(quarter_path)
+        with (path / self._totals_name).open("wb") as fi:
+            pickle.dump({"freq": self.freq, "totals": self.totals}, fi)
+        self._dirty = set()
+
+    @classmethod
+    def load(cls, path):
+        """Load aggregates saved with save."""
+        path = Path(path)
+        with (path / cls._totals_name).open("rb") as fi:
+            state = pickle.load(fi)
+        out = cls(freq=state["freq"])
+        out.totals = state["totals"]
+        for quarter_path in path.glob("????-??-??.pkl"):
+            quarter = pd.Timestamp(quarter_path.stem)
+            out.partials[quarter] = pd.read_pickle(quarter_path)
+        return out
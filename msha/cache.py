@@ -0,0 +1,86 @@
+"""
+On-disk caches for expensive per-narrative results.
+"""
+import hashlib
+import sqlite3
+from contextlib import contextmanager
+from pathlib import Path
+
+
+def narrative_hash(text):
+    """Return a hex digest identifying a (normalized) narrative string."""
+    return hashlib.blake2b(text.encode("utf8"), digest_size=16).hexdigest()
+
+
+class ClassificationCache:
+    """
+    A SQLite cache of narrative classifications, stored as integers (eg a
+    bool or a bit mask of the rules which hit).
+
+    Entries are keyed by the narrative hash and a fingerprint of the rules
+    which produced them, so results made with different rules are never
+    returned.
+
+    Parameters
+    ----------
+    path
+        The path to the SQLite database, created if it doesn't exist.
+    fingerprint
+        A string identifying the version of the classification rules.
+    """
+
+    # sqlite limits the number of parameters in a query
+    _chunk_size = 500
+
+    def __init__(self, path, fingerprint):
+        self.path = Path(path)
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+        self.fingerprint = fingerprint
+        with self._connect() as con:
+            con.execute(
+                "CREATE TABLE IF NOT EXISTS classifications ("
+                "narrative_hash TEXT, fingerprint TEXT, value INTEGER, "
+                "PRIMARY KEY (narrative_hash, fingerprint))"
+            )
+
+    @contextmanager
+    def _connect(self):
+        """Connect to the database, commit on success and always close."""
+        con = sqlite3.connect(str(self.path))
+        try:
+            with con:
+                yield con
+        finally:
+            con.close()
+
+    def get(self, keys):
+        """Return a dict of {key: int} for the keys found in the cache."""
+        keys = list(keys)
+        out = {}
+        with self._connect() as con:
+            for start in range(0, len(keys), self._chunk_size):
+                chunk = keys[start : start + self._chunk_size]
+                marks = ",".join("?" * len(chunk))
+                query = (
+                    "SELECT narrative_hash, value FROM classifications "
+                    f"WHERE fingerprint = ? AND narrative_hash IN ({marks})"
+                )
+                rows = con.execute(query, [self.fingerprint] + chunk)
+                out.update({key: int(value) for key, value in rows})
+        return out
+
+    def put(self, results):
+        """Store a dict of {key: int} in the cache."""
+        rows = [(key, self.fingerprint, int(val)) for key, val in results.items()]
+        with self._connect() as con:
+            con.executemany(
+                "INSERT OR REPLACE INTO classifications VALUES (?, ?, ?)", rows
+            )
+
+    def prune(self):
+        """Delete all entries made with other fingerprints."""
+        with self._connect() as con:
+            con.execute(
+                "DELETE FROM classifications WHERE fingerprint != ?",
+                [self.fingerprint],
+            )
@@ -0,0 +1,151 @@
+"""
+A fast linear burst classifier using hashed narrative n-grams.
+"""
+import pickle
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from sklearn.linear_model import LogisticRegression
+from sklearn.model_selection import StratifiedGroupKFold
+from sklearn.pipeline import make_pipeline
+
+from msha.linkage import link_bumps_to_accidents, prepare_bumps
+from msha.text import make_hashing_vectorizer
+
+
+def get_training_data(accident_df, bumps_df):
+    """
+    Get labeled narratives for training from the manually identified bumps.
+
+    Positives are the narratives of the accidents linked to bumps; negatives
+    are the other accidents up to the date of the last bump (see
+    get_linked_narratives). The bumps.csv narratives are researcher notes,
+    not MSHA narratives, so they aren't used as positives.
+
+    Returns
+    -------
+    A series of narratives and a bool array of labels.
+    """
+    return get_linked_narratives(accident_df, bumps_df)
+
+
+def get_linked_narratives(accident_df, bumps_df):
+    """
+    Get the unique accident narratives labeled by whether they are linked
+    to a manually identified bump, up to the date of the last bump.
+
+    The bumps.csv narratives (researcher notes) are not included, and
+    repeated narratives (eg an accident reported for each injured miner)
+    are kept once, labeled True if any of their accidents is linked, so
+    each narrative is counted once.
+
+    Returns
+    -------
+    A series of narratives and a bool array of labels.
+    """
+    bumps = prepare_bumps(bumps_df)
+    accidents = accident_df[accident_df["date"] <= bumps["date"].max()]
+    links = link_bumps_to_accidents(bumps, accidents)
+    is_linked = pd.Series(accidents.index.isin(links["accident"]))
+    narratives = accidents["narrative"].fillna("").astype(str).values
+    labels = is_linked.groupby(narratives, sort=False).any()
+    return pd.Series(labels.index, name="narrative"), labels.values
+
+
+def train_burst_model(narratives, labels, C=10.0, **kwargs):
+    """
+    Train a logistic regression on hashed n-grams of narratives.
+
+    Parameters
+    ----------
+    narratives
+        A series of narrative strings.
+    labels
+        A bool array indicating which narratives are bursts.
+    C
+        The inverse regularization strength.
+
+    kwargs are passed to msha.text.make_hashing_vectorizer.
+
+    Returns
+    -------
+    A scikit-learn pipeline which predicts from raw narrative strings.
+    """
+    model = make_pipeline(
+        make_hashing_vectorizer(**kwargs),
+        LogisticRegression(C=C, class_weight="balanced", max_iter=1000),
+    )
+    return model.fit(narratives.values, labels)
+
+
+def train_bump_model(accident_df, bumps_df, **kwargs):
+    """Train the burst model from accidents and bumps.csv (see get_training_data)."""
+    narratives, labels = get_training_data(accident_df, bumps_df)
+    return train_burst_model(narratives, labels, **kwargs)
+
+
+def cross_validate_burst_model(
+    accident_df, bumps_df, n_splits=5, random_state=42, **kwargs
+):
+    """
+    Predict each accident with a burst model which wasn't trained on it.
+
+    The accidents up to the date of the last bump are split into n_splits
+    folds, stratified by whether they are linked to a bump, with repeated
+    narratives in the same fold. Each fold is predicted by a model trained
+    on the other folds; like get_training_data the bumps.csv narratives
+    aren't used.
+
+    kwargs are passed to train_burst_model.
+
+    Returns
+    -------
+    A bool series of the out of fold predictions, indexed like the
+    accidents, and a bool array of the labels.
+    """
+    bumps = prepare_bumps(bumps_df)
+    accidents = accident_df[accident_df["date"] <= bumps["date"].max()]
+    links = link_bumps_to_accidents(bumps, accidents)
+    labels = accidents.index.isin(links["accident"])
+    narratives = accidents["narrative"].fillna("").astype(str)
+    groups, _ = pd.factorize(narratives.values)
+    folds = StratifiedGroupKFold(n_splits, shuffle=True, random_state=random_state)
+    predicted = np.zeros(len(accidents), dtype=bool)
+    for train, test in folds.split(narratives, labels, groups):
+        model = train_burst_model(narratives.iloc[train], labels[train], **kwargs)
+        predicted[test] = predict_bursts(narratives.iloc[test], model).values
+    return pd.Series(predicted, index=accidents.index), labels
+
+
+def save_burst_model(model, path):
+    """Pickle a trained burst model."""
+    path = Path(path)
+    path.parent.mkdir(exist_ok=True, parents=True)
+    with path.open("wb") as fi:
+        pickle.dump(model, fi)
+
+
+def load_burst_model(path):
+    """
+    Load a pickled burst model, only once per process for each version of
+    the file; a retrained model saved to the same path is loaded again.
+    """
+    stat = Path(path).stat()
+    return _load_burst_model(str(path), stat.st_mtime_ns, stat.st_size)
+
+
+@lru_cache(maxsize=8)
+def _load_burst_model(path, mtime_ns, size):
+    """Load a pickled burst model, cached by its path, mtime and size."""
+    with Path(path).open("rb") as fi:
+        return pickle.load(fi)
+
+
+def predict_bursts(narratives, model, threshold=0.5):
+    """Return a bool series, aligned with narratives, of predicted bursts."""
+    texts = narratives.fillna("").astype(str).values
+    probability = model.predict_proba(texts)[:, 1] if len(texts) else []
+    out = np.asarray(probability) >= threshold
+    return pd.Series(out, index=narratives.index, name=narratives.name)
@@ -42,6 +42,13 @@ DEGREE_MAP = {
     "FATALITY": "fatality/disability",
 }
 
+# columns of the accident_df with miner experience (in years)
+EXPERIENCE_COLUMNS = (
+    "total_experience",
+    "mine_experience",
+    "job_experience",
+)
+
 DEGREE_ORDER = (
     "fatality/disability",
     "restricted activity",
@@ -108,6 +115,33 @@ ROCKBURSTY_WORDS = (
     "outbursts",
 )
 
+# Correctly spelled burst terms which misspelled narrative tokens are
+# corrected to (see msha.spelling)
+BURST_VOCABULARY = (
+    "bottom",
+    "bounce",
+    "bounced",
+    "bounces",
+    "bump",
+    "bumped",
+    "bumps",
+    "burst",
+    "bursted",
+    "bursts",
+    "floor",
+    "heave",
+    "mountain",
+    "occurred",
+    "outburst",
+    "outbursts",
+    "pillar",
+    "rockburst",
+    "rockbursts",
+    "severe",
+    "suddenly",
+    "tailgate",
+)
+
 THINGS_THAT_BURST = (
     "top",
     "back",
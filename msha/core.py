@@ -1,6 +1,12 @@
 """
 Core functionality for MSHA
 """
+import hashlib
+import json
+import logging
+import re
+from contextlib import nullcontext
+
 import numpy as np
 import pandas as pd
 
@@ -17,15 +23,234 @@ from msha.constants import (
 from datetime import datetime, timezone
 
 
+from joblib import Parallel, delayed
 from sklearn.linear_model import LinearRegression
-
-import spacy
+from sklearn.model_selection import TimeSeriesSplit
+from spacy.strings import hash_string
+from spacy.symbols import NOUN, PROPN, VERB
+
+from msha.cache import ClassificationCache, narrative_hash
+from msha.classifier import load_burst_model, predict_bursts
+from msha.nlp import (
+    DEFAULT_MODEL,
+    UNUSED_COMPONENTS,
+    ParseStore,
+    get_nlp,
+    token_table,
+)
+from msha.profiling import timed, timed_iter
+from msha.sketch import describe_sketches, sketch_by_period
+from msha.spelling import correct_narratives
 
 now_utc = datetime.now(timezone.utc)
 current_year = now_utc.year
 
 bursty_set = set(ROCKBURSTY_WORDS)
 
+logger = logging.getLogger(__name__)
+
+
+def _compile_phrases(phrases):
+    """Compile phrases into a single alternation regex (longest first)."""
+    escaped = sorted({re.escape(x) for x in phrases}, key=len, reverse=True)
+    return re.compile("|".join(escaped))
+
+
+# A narrative with a strict word is a burst, one without any bursty word
+# can't satisfy any of the parse rules so it is never a burst.
+strict_burst_regex = _compile_phrases(STRICTLY_ROCKBURST_WORDS)
+bursty_regex = _compile_phrases(ROCKBURSTY_WORDS)
+
+# Increment when the logic of the burst rules (or what is cached) changes to
+# invalidate caches
+BURST_RULES_VERSION = 2
+
+
+def burst_rules_fingerprint():
+    """
+    Return a fingerprint of the burst rules; the rules version, word lists
+    and spaCy model. Cached classifications are only valid for the same one.
+    """
+    rules = dict(
+        version=BURST_RULES_VERSION,
+        strict=sorted(STRICTLY_ROCKBURST_WORDS),
+        bursty=sorted(ROCKBURSTY_WORDS),
+        things=sorted(THINGS_THAT_BURST),
+        model=DEFAULT_MODEL,
+        disabled=sorted(UNUSED_COMPONENTS),
+    )
+    rule_str = json.dumps(rules, sort_keys=True)
+    return hashlib.blake2b(rule_str.encode("utf8"), digest_size=16).hexdigest()
+
+
+# --- Mine dimension
+
+
+def _mine_positions(df, mines_df):
+    """
+    Return the positions of the rows of df and mines_df in the mine dimension.
+
+    Uses the mine_idx columns created at preprocess time if both dataframes
+    have them, else factorizes the mine_ids of mines_df.
+    """
+    if "mine_idx" in df.columns and "mine_idx" in mines_df.columns:
+        return df["mine_idx"].values, mines_df["mine_idx"].values
+    codes, uniques = pd.factorize(mines_df["mine_id"])
+    return pd.Index(uniques).get_indexer(df["mine_id"]), codes
+
+
+def _dimension_size(*position_arrays):
+    """
+    Return a dimension size which leaves the last slot unused so that
+    unknown mines (position -1) always index an empty slot.
+    """
+    return max(x.max(initial=-1) for x in position_arrays) + 2
+
+
+def is_in_mines(df, mines_df):
+    """Return a bool series indicating if the mine of each row is in mines_df."""
+    pos, mine_pos = _mine_positions(df, mines_df)
+    mask = np.zeros(_dimension_size(pos, mine_pos), dtype=bool)
+    # unknown mines in mines_df must not mark the slot of unknown mines in df
+    mask[mine_pos[mine_pos >= 0]] = True
+    return pd.Series(mask[pos], index=df.index)
+
+
+def take_mine_attribute(df, mines_df, column):
+    """
+    Return a series of mines_df[column] values for the mine of each row in df.
+
+    Rows whose mine is not in mines_df are null.
+    """
+    pos, mine_pos = _mine_positions(df, mines_df)
+    lookup = np.full(_dimension_size(pos, mine_pos), -1, dtype=np.int64)
+    is_known = mine_pos >= 0
+    lookup[mine_pos[is_known]] = np.flatnonzero(is_known)
+    values = pd.api.extensions.take(
+        mines_df[column].values, lookup[pos], allow_fill=True
+    )
+    return pd.Series(values, index=df.index, name=column)
+
+
+def mine_year_key(df):
+    """
+    Return an int64 key combining the mine and year of each row.
+
+    The mine part is mine_idx if it exists (else mine_id) so keys from
+    accidents and production line up; rows of unknown mines get negative keys.
+    """
+    mine = df["mine_idx"] if "mine_idx" in df.columns else df["mine_id"]
+    year = df["date"].dt.year.values.astype(np.int64)
+    return mine.values.astype(np.int64) * 10_000 + year
+
+
+def rates_by_mine_class(prod_df, accident_df, classes):
+    """
+    Calculate yearly injury rates (per 10^6 hours) for classes of mines.
+
+    Each production row belongs to one class (eg a size bin) and an accident
+    is attributed to every class its mine belongs to in the accident's year.
+    All classes are calculated in a single groupby.
+
+    Parameters
+    ----------
+    prod_df
+        A dataframe of production with hours_worked.
+    accident_df
+        A dataframe of the accidents to count.
+    classes
+        A column name of prod_df or an array of class labels aligned with
+        prod_df. Any binning works (pd.qcut, pd.cut, a commodity, etc.).
+
+    Returns
+    -------
+    A dataframe with a row for each year and a column for each class.
+    """
+    labels = prod_df[classes] if isinstance(classes, str) else classes
+    codes, uniques = pd.factorize(pd.Series(labels, index=prod_df.index), sort=True)
+    # rows without a class (code of -1) are dropped
+    has_class = codes >= 0
+    codes, prod_key = codes[has_class], mine_year_key(prod_df)[has_class]
+    hours_worked = prod_df["hours_worked"].values[has_class]
+    hours = pd.Series(hours_worked).groupby([codes, prod_key % 10_000]).sum()
+    # count injuries for each mine-year, then look them up for the unique
+    # (mine-year, class) pairs found in production. A sentinel key is
+    # appended so pairs with no injuries index a zero count.
+    acc_key = mine_year_key(accident_df)
+    acc_keys, acc_counts = np.unique(acc_key[acc_key >= 0], return_counts=True)
+    loc = np.searchsorted(acc_keys, prod_key)
+    acc_keys, acc_counts = np.append(acc_keys, -1), np.append(acc_counts, 0)
+    counts = np.where(acc_keys[loc] == prod_key, acc_counts[loc], 0)
+    pairs = pd.DataFrame({"key": prod_key, "code": codes, "count": counts})
+    pairs = pairs.drop_duplicates(["key", "code"])
+    year = pairs["key"] % 10_000
+    injuries = pairs.groupby([pairs["code"], year])["count"].sum()
+    rates = (injuries.reindex(hours.index, fill_value=0) / hours) * 1_000_000
+    out = rates.unstack(level=0).fillna(0)
+    out.index = pd.to_datetime(out.index.astype(str)) + pd.offsets.YearEnd(0)
+    out.columns = uniques.take(out.columns)
+    return out
+
+
+def grouped_rates(accident_df, prod_df, by, freq="q", mines_df=None):
+    """
+    Calculate injury counts, hours worked and injury rates for groups.
+
+    Numerators and exposure for all groups are aggregated in one groupby
+    each, then aligned on the periods shared by accidents and production.
+
+    Parameters
+    ----------
+    accident_df
+        A dataframe of the accidents to count.
+    prod_df
+        A dataframe of production with hours_worked.
+    by
+        A list of group keys. Each is a column of mines_df joined by mine (if
+        mines_df is provided) or else a column of both dataframes.
+    freq
+        The frequency of the periods.
+    mines_df
+        The dataframe containing the mine info.
+
+    Returns
+    -------
+    A dataframe indexed by (date, *by) with columns injuries, hours_worked
+    and injury_rate (injuries per 10^6 hours, null for groups without
+    hours worked).
+    """
+
+    def _get_group_frame(df, columns):
+        """Get a dataframe with date, group keys and the columns to aggregate."""
+        out = {"date": df["date"]}
+        for key in by:
+            if mines_df is not None and key in mines_df.columns:
+                out[key] = take_mine_attribute(df, mines_df, key)
+            elif key in df.columns:
+                out[key] = df[key]
+            else:
+                msg = f"{key} is not a column of the dataframe or mines_df"
+                raise KeyError(msg)
+        out.update({x: df[x] for x in columns})
+        return pd.DataFrame(out, index=df.index)
+
+    by = list(by)
+    keys = [pd.Grouper(key="date", freq=freq)] + by
+    acc = _get_group_frame(accident_df, [])
+    injuries = acc.groupby(keys, observed=True).size()
+    injuries.name = "injuries"
+    prod = _get_group_frame(prod_df, ["hours_worked"])
+    hours = prod.groupby(keys, observed=True)["hours_worked"].sum()
+    # only keep the periods which are found in both accidents and production
+    acc_dates = injuries.index.get_level_values(0).unique()
+    common = acc_dates.intersection(hours.index.get_level_values(0).unique())
+    out = pd.concat([injuries, hours], axis=1).fillna(0)
+    out["injuries"] = out["injuries"].astype(int)
+    out = out[out.index.get_level_values(0).isin(common)].sort_index()
+    hours_worked = out["hours_worked"].where(out["hours_worked"] > 0)
+    out["injury_rate"] = (out["injuries"] / hours_worked) * 1_000_000
+    return out
+
 
 def create_normalizer_df(prod_df, mines_df=None, freq="q"):
     """
@@ -47,8 +272,7 @@ def create_normalizer_df(prod_df, mines_df=None, freq="q"):
 
     """
     if mines_df is not None:
-        mine_ids = mines_df["mine_id"].unique()
-        prod_df = prod_df[prod_df["mine_id"].isin(mine_ids)]
+        prod_df = prod_df[is_in_mines(prod_df, mines_df)]
     # remove columns with no employees or hours worked
     has_hours = prod_df["hours_worked"] > 0
     has_employees = prod_df["employee_count"] > 0
@@ -86,8 +310,16 @@ def aggregate_injuries(df, freq="q"):
     return aggs.sum(axis=1)
 
 
-def aggregate_descriptive_stats(df, column, freq="q"):
-    """Aggregate a dataframe by quarter for one columns descriptive stats."""
+def aggregate_descriptive_stats(df, column, freq="q", sketch=False):
+    """
+    Aggregate a dataframe by quarter for one columns descriptive stats.
+
+    If sketch is True the percentiles are estimated with mergeable t-digests
+    (see msha.sketch) rather than by sorting each group.
+    """
+    if sketch:
+        sketches = sketch_by_period(df, [column], freq=freq)
+        return describe_sketches(sketches.get(column, {}))
     grouper = pd.Grouper(key="date", freq=freq)
     out = df.groupby(grouper)[column].describe()
     return out
@@ -137,17 +369,32 @@ def is_eastern_us(df):
     return df["state"].isin(set(EASTERN_STATE_CODES))
 
 
-def _is_bursty(nar_str):
-    """Parse a narrative string"""
-    nlp = spacy.load("en_core_web_sm")
+def _preprocess_narrative(nar_str):
+    """Remove parentheses and lower case a narrative string."""
+    return nar_str.replace("(", "").replace(")", "").lower()
 
-    preproc = nar_str.replace("(", "").replace(")", "").lower()
-    # First check if one of the strictly rockburst words is used
-    has_bursty_word = any([x in preproc for x in STRICTLY_ROCKBURST_WORDS])
-    if has_bursty_word:
-        return True
-    # if not use spacy to parse
-    doc = nlp(preproc)
+
+def _has_strict_burst_word(preproc):
+    """Return True if a preprocessed narrative has a strictly rockburst word."""
+    return strict_burst_regex.search(preproc) is not None
+
+
+def prefilter_narratives(preproc):
+    """
+    Run the string stages of the burst classifier on preprocessed narratives.
+
+    Returns
+    -------
+    Two bool arrays, the first indicating narratives with a strictly rockburst
+    word (bursts) and the second narratives which still need to be parsed.
+    """
+    is_strict = preproc.str.contains(strict_burst_regex).values.astype(bool)
+    has_bursty = preproc.str.contains(bursty_regex).values.astype(bool)
+    return is_strict, has_bursty & ~is_strict
+
+
+def _doc_is_bursty(doc):
+    """Apply the burst rules to a narrative parsed by spaCy."""
     # if any of the rockbursty words are used as Nouns return True
     nouns = {str(x).lower() for x in doc if x.pos_ in {"NOUN", "PROPN"}}
     if nouns & bursty_set:
@@ -171,22 +418,444 @@ def _is_bursty(nar_str):
     return False
 
 
-def probably_burst(df):
-    """return a series indicating if the accidents are likely 'rockbursty' """
+def burst_rule_hits(
+    tokens, n_docs, bursty_words=ROCKBURSTY_WORDS, things_that_burst=THINGS_THAT_BURST
+):
+    """
+    Evaluate the parse rules of the burst classifier for many docs at once.
+
+    The rules are the same as _doc_is_bursty but are evaluated as array
+    operations over a token table, so rule variants (eg other word lists)
+    can be scored over the whole corpus without walking tokens in python.
+
+    Parameters
+    ----------
+    tokens
+        The output of msha.nlp.token_table.
+    n_docs
+        The number of docs in the token table.
+    bursty_words
+        Words which indicate bursts.
+    things_that_burst
+        Words for things which can burst.
+
+    Returns
+    -------
+    A dataframe with a row for each doc and a bool column for each rule;
+    noun (a bursty word used as a noun), subject_head (a noun which can
+    burst whose head is a bursty word) and verb_head (a bursty verb whose
+    head is a thing which can burst).
+    """
+
+    def _hashes(words):
+        return np.array([hash_string(x) for x in words], dtype=np.uint64)
+
+    orth, head = tokens["orth"].values, tokens["head"].values
+    pos = tokens["pos"].values
+    is_noun = np.isin(pos, [NOUN, PROPN])
+    is_bursty = np.isin(orth, _hashes(bursty_words))
+    can_burst = np.isin(orth, _hashes(things_that_burst))
+    rules = {
+        "noun": is_noun & np.isin(tokens["lower"].values, _hashes(bursty_words)),
+        "subject_head": can_burst & is_noun & is_bursty[head],
+        "verb_head": is_bursty & (pos == VERB) & can_burst[head],
+    }
+    doc = tokens["doc"].values
+    out = {x: np.bincount(doc[hit], minlength=n_docs) > 0 for x, hit in rules.items()}
+    return pd.DataFrame(out)
 
-    is_bumpy = df["narrative"].map(_is_bursty)
-    return is_bumpy
+
+def _is_bursty(nar_str):
+    """Parse a narrative string"""
+    preproc = _preprocess_narrative(nar_str)
+    # First check if one of the strictly rockburst words is used
+    if _has_strict_burst_word(preproc):
+        return True
+    # if not use spacy to parse
+    return _doc_is_bursty(get_nlp()(preproc))
+
+
+# The burst rules, in the order _is_bursty checks them
+BURST_RULES = ("strict", "noun", "subject_head", "verb_head")
+
+
+def _classify_preprocessed(
+    preproc, batch_size=256, n_process=1, parse_path=None, timer=None
+):
+    """
+    Classify a series of preprocessed narratives.
+
+    Returns a dataframe with a bool column for each of BURST_RULES and a row
+    for each narrative.
+    """
+    with timed(timer, "prefilter"):
+        is_strict, to_parse = prefilter_narratives(preproc)
+    logger.info(
+        f"burst prefilter: {len(is_strict)} narratives, {is_strict.sum()} "
+        f"accepted by strict words, "
+        f"{len(is_strict) - is_strict.sum() - to_parse.sum()} rejected "
+        f"without bursty words, {to_parse.sum()} sent to spaCy"
+    )
+    texts = preproc[to_parse]
+    kwargs = dict(batch_size=batch_size, n_process=n_process)
+    # nlp.pipe parses lazily, a batch at a time, so each batch is timed;
+    # per narrative times would charge each batch to its first item
+    if parse_path is None:
+        docs = get_nlp().pipe(texts.values, **kwargs)
+        docs = list(timed_iter(timer, docs, "parse", batch_size))
+    else:
+        docs = ParseStore(parse_path).parse(texts, timer=timer, **kwargs)
+    with timed(timer, "rules"):
+        hits = burst_rule_hits(token_table(docs), len(docs))
+    out = np.zeros((len(preproc), len(BURST_RULES)), dtype=bool)
+    out[:, 0] = is_strict
+    out[to_parse, 1:] = hits[list(BURST_RULES[1:])].values
+    return pd.DataFrame(out, columns=list(BURST_RULES))
+
+
+def _explain_hits(hits, is_burst, is_cached=None):
+    """Add the first rule which fired (or none), the results and is_cached."""
+    conditions = [hits[x].values for x in BURST_RULES]
+    rule = np.select(conditions, BURST_RULES, default="none")
+    categories = list(BURST_RULES) + ["none"]
+    out = hits.assign(
+        rule=pd.Categorical(rule, categories=categories), is_burst=is_burst
+    )
+    if is_cached is not None:
+        out["is_cached"] = is_cached
+    return out
+
+
+def _pack_hits(hits):
+    """Return an int bit mask of the BURST_RULES hits of each row."""
+    return hits.astype(np.int64) @ (1 << np.arange(len(BURST_RULES)))
+
+
+def _unpack_hits(masks):
+    """Return a bool array of rule hits from bit masks made by _pack_hits."""
+    masks = np.asarray(masks, dtype=np.int64).reshape(-1, 1)
+    return (masks >> np.arange(len(BURST_RULES)) & 1).astype(bool)
+
+
+def classify_bursts(
+    narratives,
+    batch_size=256,
+    n_process=1,
+    cache_path=None,
+    parse_path=None,
+    explain=False,
+    timer=None,
+):
+    """
+    Classify narratives as likely rockbursts, parsing them in batches.
+
+    Narratives with a strictly rockburst word are accepted and those without
+    any rockbursty word are rejected without parsing (see
+    prefilter_narratives), the rest are streamed through spaCy's nlp.pipe.
+
+    Parameters
+    ----------
+    narratives
+        A series of narrative strings.
+    batch_size
+        The number of narratives spaCy parses per batch.
+    n_process
+        The number of processes used for parsing, -1 uses all cores.
+    cache_path
+        If not None, the path to a SQLite cache of classifications. Only
+        narratives not yet classified with the current rules (see
+        burst_rules_fingerprint) are classified, then added to the cache.
+    parse_path
+        If not None, the directory of a ParseStore. Stored parses are used
+        for rows whose narrative hasn't changed and new parses are added.
+    explain
+        If True, return which of the rules hit for each narrative.
+    timer
+        If not None, a msha.profiling.StageTimer which records the latency
+        of each stage (one latency per stage and call, except parse which
+        records one per batch).
+
+    Returns
+    -------
+    A bool series aligned with narratives or, if explain, a dataframe with
+    a bool column for each of BURST_RULES, rule (the first rule which hit or
+    "none"), is_burst and, if cache_path is given, is_cached (True for
+    narratives classified from the cache). See burst_rule_counts to
+    summarize it.
+    """
+    with timed(timer, "preprocess"):
+        preproc = narratives.fillna("").astype(str).map(_preprocess_narrative)
+    if cache_path is None:
+        hits = _classify_preprocessed(
+            preproc, batch_size, n_process, parse_path, timer
+        )
+        out = hits.any(axis=1).values
+        if explain:
+            out = _explain_hits(hits, out)
+            return out.set_index(narratives.index)
+        return pd.Series(out, index=narratives.index, name=narratives.name)
+    with timed(timer, "cache"):
+        cache = ClassificationCache(cache_path, burst_rules_fingerprint())
+        keys = np.array([narrative_hash(x) for x in preproc.values])
+        unique_keys, first, inverse = np.unique(
+            keys, return_index=True, return_inverse=True
+        )
+        known = cache.get(unique_keys)
+    # the cache stores the rule hits, so cached rows can be explained too
+    is_new = np.array([x not in known for x in unique_keys], dtype=bool)
+    hits = _unpack_hits([known.get(x, 0) for x in unique_keys])
+    new_preproc = preproc.iloc[first[is_new]]
+    new_hits = _classify_preprocessed(
+        new_preproc, batch_size, n_process, parse_path, timer
+    )
+    hits[is_new] = new_hits.values
+    with timed(timer, "cache"):
+        cache.put(dict(zip(unique_keys[is_new], _pack_hits(hits[is_new]))))
+    inverse = inverse.ravel()
+    out = hits.any(axis=1)[inverse]
+    if explain:
+        hits = pd.DataFrame(hits[inverse], columns=list(BURST_RULES))
+        out = _explain_hits(hits, out, is_cached=~is_new[inverse])
+        return out.set_index(narratives.index)
+    return pd.Series(out, index=narratives.index, name=narratives.name)
+
+
+def burst_rule_counts(explanation):
+    """
+    Count the rule hits of the output of classify_bursts with explain=True.
+
+    Returns
+    -------
+    A dataframe indexed by rule with the number of narratives each rule hit
+    (rules are not exclusive) and the number for which it was the first
+    rule to hit.
+    """
+    rules = list(BURST_RULES) + ["none"]
+    hits = explanation[list(BURST_RULES)].sum().reindex(rules, fill_value=0)
+    fired = explanation["rule"].value_counts().reindex(rules, fill_value=0)
+    out = pd.DataFrame({"hits": hits, "fired": fired})
+    out.index.name = "rule"
+    return out
+
+
+def probably_burst(
+    df,
+    batch_size=256,
+    n_process=1,
+    cache_path=None,
+    parse_path=None,
+    method="rules",
+    model_path=None,
+    correct_spelling=False,
+):
+    """
+    return a series indicating if the accidents are likely 'rockbursty'
+
+    method is either "rules", which uses the word lists and spaCy parse
+    rules (see classify_bursts), or "linear" which uses the hashed n-gram
+    model saved at model_path (see msha.classifier) and is much faster.
+
+    If correct_spelling is True, misspelled burst terms are corrected first
+    (see msha.spelling.correct_narratives). It can also be a dict of
+    corrections, eg from find_corrections on the whole corpus, since few
+    narratives give little evidence of which tokens are typos.
+    """
+    narratives = df["narrative"]
+    if correct_spelling:
+        corrections = correct_spelling if isinstance(correct_spelling, dict) else None
+        narratives = correct_narratives(narratives, corrections)
+    if method == "linear":
+        if model_path is None:
+            raise ValueError("model_path is required for the linear method")
+        model = load_burst_model(str(model_path))
+        return predict_bursts(narratives, model)
+    elif method != "rules":
+        raise ValueError(f"unknown burst classification method {method}")
+    return classify_bursts(
+        narratives,
+        batch_size=batch_size,
+        n_process=n_process,
+        cache_path=cache_path,
+        parse_path=parse_path,
+    )
 
 
 # --- SKlearn stuff
 
 
+# LinearRegression kwargs which don't change its predictions
+_OLS_KWARGS = {"normalize", "copy_X", "n_jobs", "fit_intercept"}
+
+
+def _is_ols(regressor, kwargs):
+    """Return True if regressor(**kwargs) is an ordinary least squares fit."""
+    return regressor is LinearRegression and set(kwargs) <= _OLS_KWARGS
+
+
+def _make_folds(X, y, cv=None):
+    """
+    Return a list of (X_train, y_train, X_test, y_test) tuples.
+
+    If cv is None the data are scored in sample (one fold whose train and
+    test sets are the same), an int gives that many rolling origin folds
+    (see sklearn's TimeSeriesSplit), else cv is a splitter with a split
+    method.
+    """
+    if cv is None:
+        return [(X, y, X, y)]
+    splitter = TimeSeriesSplit(n_splits=cv) if isinstance(cv, int) else cv
+    return [
+        (X[train], y[train], X[test], y[test]) for train, test in splitter.split(X)
+    ]
+
+
+class _OLSFold:
+    """
+    The state of a forward selected OLS fit on one fold.
+
+    basis is an orthonormal basis (the Q of a QR decomposition) of the
+    selected training columns and test_basis is the same combination of
+    the test columns, so the fit's test predictions are
+    test_basis @ basis.T @ y_train.
+    """
+
+    def __init__(self, X_train, y_train, X_test, y_test, fit_intercept=True):
+        self.X_train, self.X_test, self.y_test = X_train, X_test, y_test
+        n_train = len(y_train)
+        if fit_intercept:
+            self.basis = np.full((n_train, 1), 1 / np.sqrt(n_train))
+            self.test_basis = np.full((len(y_test), 1), 1 / np.sqrt(n_train))
+        else:
+            self.basis = np.empty((n_train, 0))
+            self.test_basis = np.empty((len(y_test), 0))
+        weights = self.basis.T @ y_train
+        self.residual = y_train - self.basis @ weights
+        self.prediction = self.test_basis @ weights
+
+    def step(self, columns):
+        """
+        Score adding each of columns to the fit.
+
+        Returns
+        -------
+        The mean absolute test error with each column added and a function
+        which adds the column at a position to the fit.
+        """
+        candidates = self.X_train[:, columns]
+        # project twice for accuracy, tracking the coefficients for the test set
+        coefs = self.basis.T @ candidates
+        perp = candidates - self.basis @ coefs
+        correction = self.basis.T @ perp
+        perp -= self.basis @ correction
+        coefs += correction
+        test_perp = self.X_test[:, columns] - self.test_basis @ coefs
+        # columns in the span of the basis add nothing so get zero vectors
+        norms = np.linalg.norm(perp, axis=0)
+        scales = np.maximum(np.linalg.norm(candidates, axis=0), 1)
+        norms = np.where(norms > 1e-10 * scales, norms, np.inf)
+        vectors, test_vectors = perp / norms, test_perp / norms
+        weights = self.residual @ vectors
+        predictions = self.prediction[:, None] + test_vectors * weights
+        scores = np.abs(self.y_test[:, None] - predictions).mean(axis=0)
+
+        def _add(position):
+            self.basis = np.column_stack([self.basis, vectors[:, position]])
+            self.test_basis = np.column_stack(
+                [self.test_basis, test_vectors[:, position]]
+            )
+            self.residual = self.residual - vectors[:, position] * weights[position]
+            self.prediction = predictions[:, position]
+
+        return scores, _add
+
+
+def _select_ols(folds, k, fit_intercept=True):
+    """
+    Forward select k columns for OLS fits by mean absolute error over folds.
+
+    Rather than refitting for every candidate, each fold keeps an
+    orthonormal basis of its selected columns which grows by one column
+    each step (a rank-one QR update), and all candidates are scored with a
+    few matrix products.
+
+    Returns
+    -------
+    The positions of the selected columns and the score after each step.
+    """
+    states = [_OLSFold(*x, fit_intercept=fit_intercept) for x in folds]
+    available, selected, step_scores = list(range(folds[0][0].shape[1])), [], []
+    while len(selected) < k and available:
+        steps = [x.step(available) for x in states]
+        scores = np.mean([x[0] for x in steps], axis=0)
+        best = int(np.argmin(scores))
+        for _, add in steps:
+            add(best)
+        step_scores.append(scores[best])
+        selected.append(available.pop(best))
+    return selected, step_scores
+
+
+def _score_columns(folds, columns, regressor, kwargs):
+    """Fit a regressor to some columns on each fold, return the mean MAE."""
+    scores = []
+    for X_train, y_train, X_test, y_test in folds:
+        reg = regressor(**kwargs).fit(X_train[:, columns], y_train)
+        scores.append(np.mean(abs(reg.predict(X_test[:, columns]) - y_test)))
+    return np.mean(scores)
+
+
+def _select_with_regressor(folds, k, regressor, kwargs, n_workers=None, prefer=None):
+    """
+    Forward select k columns for a regressor by mean absolute error over
+    folds, fitting the regressor for each candidate and fold.
+
+    If n_workers is not None the candidates of each step are scored in a
+    joblib pool which is reused for every step; threads share the fold
+    matrices and worker processes get them as read-only memory maps (dumped
+    once, whatever their size) rather than pickled copies in every task.
+    Scores come back in candidate order and ties go to the first candidate,
+    so the result doesn't depend on the number of workers.
+
+    Returns
+    -------
+    The positions of the selected columns and the score after each step.
+    """
+    available, selected, step_scores = list(range(folds[0][0].shape[1])), [], []
+    pool = None
+    if n_workers:
+        pool = Parallel(n_jobs=n_workers, prefer=prefer, max_nbytes=0, mmap_mode="r")
+    with pool or nullcontext():
+        while len(selected) < k and available:
+            tasks = [(folds, selected + [x], regressor, kwargs) for x in available]
+            if pool is None:
+                scores = [_score_columns(*x) for x in tasks]
+            else:
+                scores = pool(delayed(_score_columns)(*x) for x in tasks)
+            best = int(np.argmin(scores))
+            step_scores.append(scores[best])
+            selected.append(available.pop(best))
+    return selected, step_scores
+
+
 def select_k_best_regression(
-    feature_df, target, k=4, regressor=LinearRegression, **kwargs
+    feature_df,
+    target,
+    k=4,
+    regressor=LinearRegression,
+    n_workers=None,
+    prefer="processes",
+    cv=None,
+    return_scores=False,
+    **kwargs,
 ):
     """
     Get the k best features for prediction.
 
+    Features are selected greedily; each step adds the feature which gives
+    the lowest mean absolute error. For plain linear regression all the
+    candidates of a step are scored at once with QR updates (see
+    _select_ols) rather than by fitting a regressor for each.
+
     Parameters
     ----------
     feature_df
@@ -197,36 +866,42 @@ def select_k_best_regression(
         The number of features to predict
     regressor
         A scikit learn regressor. Default is linear regression.
+    n_workers
+        If not None, the number of workers (-1 for all cores) which score
+        the candidates of a regressor in parallel. Not used for linear
+        regression, which doesn't fit a model for each candidate.
+    prefer
+        "processes" or "threads", the kind of workers to use.
+    cv
+        If None features are scored in sample. Else the number of rolling
+        origin folds (rows must be in time order), each trained on the rows
+        before its test rows, or a splitter such as TimeSeriesSplit. Errors
+        are then out of sample, averaged over folds. The fold matrices are
+        made once and reused for every candidate and step.
+    return_scores
+        If True also return the score after each selection step.
 
     kwargs are passed to the regressor.
 
     Returns
     -------
-    A dataframe with the selected features.
-    """
-
-    def get_best_score(current, candidates):
-        """Get the name of the next best feature"""
-        # iterate each unused feature and track improvements to score
-        scores = {}
-        for name, series in candidates.iteritems():
-            cur = np.atleast_2d(current.values)
-            can = series.values[..., np.newaxis]
-            X = np.hstack([cur, can])
-            reg = regressor(**kwargs).fit(X, target.values)
-            scores[name] = np.mean(abs(reg.predict(X) - target.values))
-        return pd.Series(scores).argmin()
-
-    selected = []
-    while len(selected) < k:
-        current = feature_df[selected]
-        candidates = feature_df.drop(columns=selected)
-        # bail out if not enough features remain
-        if not len(candidates.columns):
-            break
-        name = get_best_score(current, candidates)
-        selected.append(name)
-    return feature_df[selected]
+    A dataframe with the selected features and, if return_scores, a series
+    of the mean absolute error after adding each selected feature.
+    """
+    X = feature_df.values.astype(np.float64)
+    y = np.asarray(target, dtype=np.float64)
+    folds = _make_folds(X, y, cv)
+    if _is_ols(regressor, kwargs):
+        fit_intercept = kwargs.get("fit_intercept", True)
+        selected, scores = _select_ols(folds, k, fit_intercept=fit_intercept)
+    else:
+        selected, scores = _select_with_regressor(
+            folds, k, regressor, kwargs, n_workers=n_workers, prefer=prefer
+        )
+    out = feature_df.iloc[:, selected]
+    if return_scores:
+        return out, pd.Series(scores, index=out.columns, name="mae")
+    return out
 
 
 if __name__ == "__main__":
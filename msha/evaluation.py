@@ -0,0 +1,157 @@
+"""
+Evaluation of the burst classifier against manually identified bumps.
+"""
+import resource
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from msha.classifier import cross_validate_burst_model
+from msha.core import probably_burst
+from msha.linkage import link_bumps_to_accidents, prepare_bumps
+
+
+def classification_scores(predicted, labeled):
+    """Return a series of precision, recall and f1 from two bool arrays."""
+    predicted, labeled = np.asarray(predicted, bool), np.asarray(labeled, bool)
+    true_positives = (predicted & labeled).sum()
+    precision = true_positives / predicted.sum() if predicted.sum() else np.nan
+    recall = true_positives / labeled.sum() if labeled.sum() else np.nan
+    has_scores = precision + recall > 0
+    f1 = 2 * precision * recall / (precision + recall) if has_scores else np.nan
+    out = dict(
+        labeled=labeled.sum(),
+        predicted=predicted.sum(),
+        true_positives=true_positives,
+        precision=precision,
+        recall=recall,
+        f1=f1,
+    )
+    return pd.Series(out)
+
+
+def _max_rss_mb():
+    """Return the peak resident memory (MB) of this process so far."""
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes elsewhere
+    return max_rss / 1_000_000 if sys.platform == "darwin" else max_rss / 1_000
+
+
+def _labeled_accidents(accident_df, bumps_df):
+    """
+    Return the accidents up to the date of the last bump, a bool array of
+    which are linked to a bump and the number of linked bumps.
+    """
+    bumps = prepare_bumps(bumps_df)
+    accidents = accident_df[accident_df["date"] <= bumps["date"].max()]
+    links = link_bumps_to_accidents(bumps, accidents)
+    labeled = accidents.index.isin(links["accident"])
+    return accidents, labeled, links["bump"].nunique()
+
+
+def score_burst_predictions(accident_df, bumps_df, predicted):
+    """
+    Score existing burst predictions against the manually identified bumps.
+
+    Parameters
+    ----------
+    accident_df
+        The classified accidents, eg UG coal GC injuries.
+    bumps_df
+        The manually identified bumps (inputs/bumps.csv).
+    predicted
+        The index labels of the accidents predicted to be bursts, eg the
+        index of the output of get_coal_bump_df.
+
+    Returns
+    -------
+    A series with the counts and scores from classification_scores and the
+    number of linked bumps.
+    """
+    accidents, labeled, linked_bumps = _labeled_accidents(accident_df, bumps_df)
+    out = classification_scores(accidents.index.isin(predicted), labeled)
+    out["narratives"] = len(accidents)
+    out["linked_bumps"] = linked_bumps
+    return out
+
+
+def evaluate_burst_classifier(
+    accident_df, bumps_df, classifier=probably_burst, memory=False, **kwargs
+):
+    """
+    Score and benchmark a burst classifier against the manually identified
+    bumps.
+
+    Only accidents up to the date of the last bump are used, since later
+    bumps are not in the list. The list is not complete so precision is a
+    lower bound. To score predictions which were already made use
+    score_burst_predictions.
+
+    Parameters
+    ----------
+    accident_df
+        The accidents to classify, eg UG coal GC injuries.
+    bumps_df
+        The manually identified bumps (inputs/bumps.csv).
+    classifier
+        A function which takes accident_df and returns a bool series.
+    memory
+        If True classify once more, before the timed run, while tracing
+        the peak memory allocated by Python. Tracing slows classification
+        so the throughput is measured in a separate untraced run.
+
+    kwargs are passed to the classifier.
+
+    Returns
+    -------
+    A series with the counts and scores from classification_scores, the
+    number of linked bumps and the narratives classified per second. With
+    memory, the peak memory (MB) allocated through Python while
+    classifying and the peak resident memory of the process afterwards
+    (which includes allocations tracemalloc can't see, eg by spaCy or
+    numpy, but also everything before classifying).
+    """
+    accidents, labeled, linked_bumps = _labeled_accidents(accident_df, bumps_df)
+    if memory:
+        tracemalloc.start()
+        try:
+            classifier(accidents, **kwargs)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    start = time.perf_counter()
+    predicted = classifier(accidents, **kwargs)
+    elapsed = time.perf_counter() - start
+    out = classification_scores(predicted.values, labeled)
+    out["narratives"] = len(accidents)
+    out["linked_bumps"] = linked_bumps
+    out["seconds"] = elapsed
+    out["narratives_per_second"] = len(accidents) / elapsed if elapsed else np.nan
+    if memory:
+        out["peak_memory_mb"] = peak / 1_000_000
+        out["max_rss_mb"] = _max_rss_mb()
+    return out
+
+
+def evaluate_burst_model(accident_df, bumps_df, n_splits=5, **kwargs):
+    """
+    Score the linear burst model against the manually identified bumps with
+    cross validation, so no accident is scored by a model trained on it
+    (see msha.classifier.cross_validate_burst_model).
+
+    kwargs are passed to cross_validate_burst_model.
+
+    Returns
+    -------
+    A series with the counts and scores from classification_scores and the
+    number of narratives.
+    """
+    predicted, labeled = cross_validate_burst_model(
+        accident_df, bumps_df, n_splits=n_splits, **kwargs
+    )
+    out = classification_scores(predicted.values, labeled)
+    out["narratives"] = len(predicted)
+    return out
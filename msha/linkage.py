@@ -0,0 +1,409 @@
+"""
+Linking manually identified bumps to accidents and mines.
+"""
+import zlib
+
+import numpy as np
+import pandas as pd
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from msha.text import normalize_name, normalize_text
+
+# A Mersenne prime used for the universal hash functions of MinHash; small
+# enough that a * hash + b (all below it) fits in a uint64, so the modulo
+# wraps and each hash function orders the shingles differently
+_MINHASH_PRIME = np.uint64((1 << 31) - 1)
+
+
+def _shingle_hashes(text, k):
+    """Return an array of the crc32 hashes of the character k-shingles of text."""
+    text = normalize_text(text)
+    shingles = {text[i : i + k] for i in range(max(len(text) - k + 1, 1))}
+    hashes = (zlib.crc32(x.encode("utf8")) for x in shingles)
+    return np.fromiter(hashes, dtype=np.uint64, count=len(shingles))
+
+
+def minhash_signatures(texts, num_perm=64, k=5, seed=42):
+    """
+    Calculate MinHash signatures of the character shingles of texts.
+
+    The fraction of equal values in two signatures estimates the Jaccard
+    similarity of the texts' shingle sets.
+
+    Parameters
+    ----------
+    texts
+        An iterable of strings.
+    num_perm
+        The number of hash functions (the length of each signature).
+    k
+        The number of characters in each shingle.
+    seed
+        The random seed for the hash functions.
+
+    Returns
+    -------
+    A uint64 array with a row for each text.
+    """
+    rng = np.random.RandomState(seed)
+    prime = int(_MINHASH_PRIME)
+    a = rng.randint(1, prime, num_perm).astype(np.uint64)[:, None]
+    b = rng.randint(0, prime, num_perm).astype(np.uint64)[:, None]
+    texts = list(texts)
+    out = np.empty((len(texts), num_perm), dtype=np.uint64)
+    for num, text in enumerate(texts):
+        hashes = _shingle_hashes(text, k) % _MINHASH_PRIME
+        out[num] = ((a * hashes + b) % _MINHASH_PRIME).min(axis=1)
+    return out
+
+
+def _band_keys(signatures, bands):
+    """Hash each band of the signatures into a single key, shape (n, bands)."""
+    rows = signatures.shape[1] // bands
+    banded = signatures[:, : bands * rows].reshape(len(signatures), bands, rows)
+    multipliers = np.random.RandomState(0).randint(1, 2 ** 31, rows)
+    # overflow just wraps, which is fine for hashing
+    with np.errstate(over="ignore"):
+        return (banded * multipliers.astype(np.uint64)).sum(axis=2)
+
+
+def lsh_candidates(left, right, bands=16, left_blocks=None, right_blocks=None):
+    """
+    Find candidate pairs of similar signatures with LSH banding.
+
+    Pairs which share the key of any band (and their blocking keys) are
+    found with a join, so all pairs are never compared.
+
+    Parameters
+    ----------
+    left, right
+        Signature arrays from minhash_signatures.
+    bands
+        The number of bands; more bands find less similar pairs.
+    left_blocks, right_blocks
+        Optional dataframes of blocking keys, with a row for each signature.
+        Only pairs with equal blocking keys are candidates.
+
+    Returns
+    -------
+    A dataframe with columns left and right (row numbers of the signatures).
+    """
+
+    def _band_frame(signatures, blocks, name):
+        keys = _band_keys(signatures, bands)
+        out = pd.DataFrame(
+            {
+                name: np.repeat(np.arange(len(signatures)), bands),
+                "band": np.tile(np.arange(bands), len(signatures)),
+                "key": keys.ravel(),
+            }
+        )
+        if blocks is not None:
+            blocks = blocks.reset_index(drop=True)
+            out = out.join(blocks, on=name)
+        return out
+
+    on = ["band", "key"]
+    if left_blocks is not None:
+        on += list(left_blocks.columns)
+    left_df = _band_frame(left, left_blocks, "left")
+    right_df = _band_frame(right, right_blocks, "right")
+    merged = pd.merge(left_df, right_df, on=on)
+    return merged[["left", "right"]].drop_duplicates(ignore_index=True)
+
+
+def _accident_states(accident_df, mines_df=None):
+    """
+    Return an array of the state of each accident, from its state column or
+    else the state of its mine in mines_df, or None if neither is known.
+    """
+    if "state" in accident_df.columns:
+        return accident_df["state"].values
+    if mines_df is None:
+        return None
+    states = mines_df.drop_duplicates("mine_id").set_index("mine_id")["state"]
+    return accident_df["mine_id"].map(states).values
+
+
+def link_bumps_fuzzy(
+    bumps_df,
+    accident_df,
+    threshold=0.5,
+    date_tolerance=1,
+    num_perm=64,
+    bands=32,
+    mines_df=None,
+):
+    """
+    Link bumps to accidents by the similarity of their narratives.
+
+    Candidates are found with MinHash-LSH, blocked by date (within
+    date_tolerance days) and by state if accident_df has a state column or
+    mines_df is given to look up the state of each accident's mine.
+    A pair with Jaccard similarity s is a candidate with probability
+    1 - (1 - s ** r) ** bands, where r = num_perm // bands rows per band.
+    The default 32 bands of 2 rows find pairs at the 0.5 threshold with
+    probability 0.9999 (0.95 at 0.3); the date blocks keep the extra
+    candidates of fewer rows per band few.
+
+    Parameters
+    ----------
+    bumps_df
+        The output of prepare_bumps.
+    accident_df
+        The accidents to link to.
+    threshold
+        The minimum estimated Jaccard similarity of a link.
+    date_tolerance
+        The maximum number of days between a bump and a linked accident.
+    num_perm
+        The length of the MinHash signatures.
+    bands
+        The number of LSH bands; more bands of fewer rows find less
+        similar pairs but give more candidates.
+    mines_df
+        The mines table (with mine_id and state), eg pp_mines.
+
+    Returns
+    -------
+    A dataframe with columns bump and accident (index labels of each
+    dataframe) and score (estimated Jaccard similarity), best first.
+    """
+    # block on dates, repeating bumps for each day of tolerance
+    offsets = np.arange(-date_tolerance, date_tolerance + 1) * np.timedelta64(1, "D")
+    bump_rows = np.repeat(np.arange(len(bumps_df)), len(offsets))
+    bump_dates = bumps_df["date"].dt.normalize().values[bump_rows]
+    bump_blocks = pd.DataFrame({"date": bump_dates + np.tile(offsets, len(bumps_df))})
+    # accidents outside of all date blocks can never be linked so are skipped
+    accident_df = accident_df[
+        accident_df["date"].dt.normalize().isin(bump_blocks["date"])
+    ]
+    bump_sigs = minhash_signatures(bumps_df["narrative"], num_perm=num_perm)
+    acc_sigs = minhash_signatures(accident_df["narrative"], num_perm=num_perm)
+    acc_blocks = pd.DataFrame({"date": accident_df["date"].dt.normalize().values})
+    states = _accident_states(accident_df, mines_df)
+    if states is not None:
+        bump_blocks["state"] = bumps_df["stateabb"].values[bump_rows]
+        acc_blocks["state"] = states
+    pairs = lsh_candidates(
+        bump_sigs[bump_rows], acc_sigs, bands, bump_blocks, acc_blocks
+    )
+    bump_num, acc_num = bump_rows[pairs["left"].values], pairs["right"].values
+    score = (bump_sigs[bump_num] == acc_sigs[acc_num]).mean(axis=1)
+    out = pd.DataFrame(
+        {
+            "bump": bumps_df.index.values[bump_num],
+            "accident": accident_df.index.values[acc_num],
+            "score": score,
+        }
+    )
+    out = out[out["score"] >= threshold].drop_duplicates(["bump", "accident"])
+    return out.sort_values("score", ascending=False, ignore_index=True)
+
+
+def prepare_bumps(bumps_df):
+    """
+    Parse the manually identified bumps (inputs/bumps.csv).
+
+    Adds a nullable integer mine_id (mineid is often 'na'), parses the
+    dates and a normalized narrative.
+    """
+    mine_id = pd.to_numeric(bumps_df["mineid"], errors="coerce").astype("Int64")
+    return bumps_df.assign(
+        mine_id=mine_id,
+        date=pd.to_datetime(bumps_df["date"]),
+        normalized_narrative=bumps_df["narrative"].map(normalize_text),
+    )
+
+
+def link_bumps_to_accidents(bumps_df, accident_df, fuzzy=False, mines_df=None):
+    """
+    Link bumps to accidents by mine_id and date, else by exact narrative,
+    else (if fuzzy) by narrative similarity (see link_bumps_fuzzy).
+
+    Parameters
+    ----------
+    bumps_df
+        The output of prepare_bumps.
+    accident_df
+        The accidents to link to.
+    fuzzy
+        If True, link the remaining bumps with link_bumps_fuzzy. Off by
+        default so the labels used to evaluate and train the burst
+        classifiers only come from exact links.
+    mines_df
+        The mines table, used by link_bumps_fuzzy to block on state.
+
+    Returns
+    -------
+    A dataframe with columns bump and accident (index labels of each
+    dataframe), method (how they were linked) and score (1 for exact links).
+    """
+    bumps = bumps_df.rename_axis("bump").reset_index()
+    accidents = accident_df.rename_axis("accident").reset_index()
+    accidents = accidents.assign(date=accidents["date"].dt.normalize())
+    # first link on mine and date
+    with_mine = bumps[bumps["mine_id"].notnull()]
+    with_mine = with_mine.assign(mine_id=with_mine["mine_id"].astype(np.int64))
+    cols = ["mine_id", "date"]
+    by_mine = pd.merge(with_mine[["bump"] + cols], accidents[["accident"] + cols])
+    by_mine["method"] = "mine_date"
+    # then link the rest on their normalized narratives
+    unlinked = bumps[~bumps["bump"].isin(by_mine["bump"])]
+    narratives = accidents["narrative"].map(normalize_text)
+    accidents = accidents.assign(normalized_narrative=narratives)
+    cols = ["normalized_narrative"]
+    by_narrative = pd.merge(unlinked[["bump"] + cols], accidents[["accident"] + cols])
+    by_narrative["method"] = "narrative"
+    links = [by_mine, by_narrative]
+    # and finally link the rest by narrative similarity
+    linked = pd.concat(links)["bump"]
+    if fuzzy:
+        unlinked = bumps_df[~bumps_df.index.isin(linked)]
+        by_similarity = link_bumps_fuzzy(unlinked, accident_df, mines_df=mines_df)
+        links.append(by_similarity.assign(method="fuzzy"))
+    out = pd.concat(links, ignore_index=True)
+    out["score"] = out["score"].fillna(1.0) if "score" in out else 1.0
+    return out[["bump", "accident", "method", "score"]]
+
+
+def _name_vectors(*names, ngram_range=(2, 3)):
+    """Return l2 normalized tf-idf vectors of the character n-grams of names."""
+    # names repeat a lot (eg "1") so only the unique names are vectorized
+    codes, uniques = pd.factorize(pd.concat(names, ignore_index=True))
+    vectorizer = TfidfVectorizer(analyzer="char_wb", ngram_range=ngram_range)
+    vectors = vectorizer.fit_transform(uniques)
+    splits = np.cumsum([len(x) for x in names])[:-1]
+    return [vectors[x] for x in np.split(codes, splits)]
+
+
+def _name_numbers(names):
+    """Return the set of numbers in each normalized name."""
+    return names.str.findall(r"\d+").map(frozenset)
+
+
+def _link_bumps_by_name(bumps, mines, company_weight, company_columns, candidates):
+    """
+    Link each bump to the mine in its state with the best scoring names
+    (see link_bumps_to_mines), return a dataframe indexed by bump with
+    mine_id, method and score columns.
+    """
+    out = pd.DataFrame(
+        {
+            "mine_id": pd.Series(dtype=np.int64),
+            "method": pd.Series(dtype=object),
+            "score": pd.Series(dtype=np.float64),
+        },
+        index=bumps.index[:0],
+    )
+    if bumps.empty or mines.empty:
+        return out
+    bump_names = normalize_name(bumps["minename"].values)
+    mine_names = normalize_name(mines["current_mine_name"])
+    bump_vecs, mine_vecs = _name_vectors(bump_names, mine_names)
+    columns = [x for x in company_columns if x in mines.columns]
+    if columns:
+        companies = [normalize_name(mines[x]) for x in columns]
+        bump_company = normalize_name(bumps["company_name"].values)
+        company_vecs = _name_vectors(bump_company, *companies)
+    bump_numbers = _name_numbers(bump_names).values
+    mine_numbers = _name_numbers(mine_names).values
+    # compare bumps only to mines in the same state
+    bump_blocks = pd.DataFrame({"state": bumps["stateabb"].values})
+    mine_blocks = mines.groupby("state").indices
+    links = {}
+    for state, bump_rows in bump_blocks.groupby("state").indices.items():
+        mine_rows = mine_blocks.get(state)
+        if mine_rows is None:
+            continue
+        score = (bump_vecs[bump_rows] @ mine_vecs[mine_rows].T).toarray()
+        if columns:
+            left = company_vecs[0][bump_rows]
+            company = [(left @ x[mine_rows].T).toarray() for x in company_vecs[1:]]
+            score = (1 - company_weight) * score
+            score += company_weight * np.maximum.reduce(company)
+        # check the numbers of the best few candidates of each bump
+        best = np.argsort(-score, axis=1)[:, :candidates]
+        for num, (bump_row, mine_cols) in enumerate(zip(bump_rows, best)):
+            bump_num = bump_numbers[bump_row]
+            for mine_col in mine_cols:
+                mine_num = mine_numbers[mine_rows[mine_col]]
+                if bump_num and mine_num and not bump_num & mine_num:
+                    continue
+                links[bump_row] = (mine_rows[mine_col], score[num, mine_col])
+                break
+    if not links:
+        return out
+    rows = np.array([x for x in links], dtype=np.int64)
+    mine_rows = np.array([x[0] for x in links.values()], dtype=np.int64)
+    return pd.DataFrame(
+        {
+            "mine_id": mines["mine_id"].values[mine_rows],
+            "method": "name",
+            "score": np.array([x[1] for x in links.values()], dtype=np.float64),
+        },
+        index=bumps.index[rows],
+    )
+
+
+def link_bumps_to_mines(
+    bumps_df,
+    mines_df,
+    threshold=0.6,
+    company_weight=0.3,
+    company_columns=("operator_name", "controller_name"),
+    candidates=5,
+):
+    """
+    Link bumps to mines by mine id, else by the similarity of names.
+
+    Mine names (and company names, if mines_df has any company_columns) are
+    normalized with normalize_name and compared with the cosine similarity
+    of their character n-gram tf-idf vectors. Only mines in the bump's state
+    are compared, and names which both contain numbers must share one, so
+    "No. 2 Mine" never matches "No. 5 Mine".
+
+    Parameters
+    ----------
+    bumps_df
+        The output of prepare_bumps.
+    mines_df
+        The mines to link to, eg pp_mines.
+    threshold
+        The minimum score of a link.
+    company_weight
+        The weight of the company name similarity in the score, the mine
+        name similarity has a weight of 1 - company_weight.
+    company_columns
+        The columns of mines_df with company names; the best match is used.
+    candidates
+        The number of best scoring mines checked for matching numbers.
+
+    Returns
+    -------
+    A dataframe indexed by bump (the index labels of bumps_df) with columns
+    mine_id, method ("mine_id" or "name") and score (1 for id links).
+    Bumps with a mine id which isn't in mines_df are not linked, rather
+    than guessing a different mine by name.
+    """
+    has_id = bumps_df["mine_id"].notnull()
+    in_mines = has_id & bumps_df["mine_id"].isin(mines_df["mine_id"])
+    by_id = pd.DataFrame(
+        {"mine_id": bumps_df.loc[in_mines, "mine_id"].astype(np.int64)},
+        index=bumps_df.index[in_mines],
+    ).assign(method="mine_id", score=1.0)
+    # only bumps without a mine id are matched by name, and only to mines in
+    # their states
+    bumps = bumps_df[~has_id]
+    mines = mines_df[mines_df["state"].isin(bumps["stateabb"])]
+    by_name = _link_bumps_by_name(
+        bumps,
+        mines.reset_index(drop=True),
+        company_weight=company_weight,
+        company_columns=company_columns,
+        candidates=candidates,
+    )
+    by_name = by_name[by_name["score"] >= threshold]
+    out = pd.concat([by_id, by_name]).sort_index()
+    out.index.name = "bump"
+    return out
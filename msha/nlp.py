@@ -0,0 +1,151 @@
+"""
+Loading spaCy models for parsing accident narratives.
+"""
+import multiprocessing
+import pickle
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import spacy
+from spacy.tokens import DocBin
+
+from msha.profiling import timed_iter
+
+DEFAULT_MODEL = "en_core_web_sm"
+
+# Pipeline components the burst rules never use (they only need POS and heads)
+UNUSED_COMPONENTS = ("ner", "lemmatizer")
+
+
+@lru_cache(maxsize=None)
+def get_nlp(model=DEFAULT_MODEL, disable=UNUSED_COMPONENTS):
+    """
+    Return a spaCy model, loading it only once per process.
+
+    Parameters
+    ----------
+    model
+        The name of the spaCy model.
+    disable
+        A tuple of pipeline components to disable.
+    """
+    return spacy.load(model, disable=list(disable))
+
+
+def warm_worker(model=DEFAULT_MODEL, disable=UNUSED_COMPONENTS):
+    """Load the model in a worker process so its first task doesn't have to."""
+    get_nlp(model, disable)
+
+
+def make_worker_pool(processes=None, model=DEFAULT_MODEL, disable=UNUSED_COMPONENTS):
+    """Create a process pool whose workers have the model pre-loaded."""
+    return multiprocessing.Pool(
+        processes, initializer=warm_worker, initargs=(model, disable)
+    )
+
+
+def token_table(docs):
+    """
+    Flatten docs into a dataframe with a row for each token.
+
+    The columns are doc (the position of the token's doc), orth and lower
+    (string hashes, see spacy.strings.hash_string), pos (a spacy.symbols id)
+    and head (the row of the token's head).
+    """
+    docs = list(docs)
+    attrs = ["ORTH", "LOWER", "POS", "HEAD"]
+    arrays = [doc.to_array(attrs).reshape(-1, len(attrs)) for doc in docs]
+    lengths = [len(x) for x in arrays]
+    values = np.concatenate(arrays) if arrays else np.empty((0, 4), np.uint64)
+    # HEAD is an offset from the token, convert it to a row number
+    row = np.arange(len(values))
+    out = pd.DataFrame(
+        {
+            "doc": np.repeat(np.arange(len(docs)), lengths),
+            "orth": values[:, 0],
+            "lower": values[:, 1],
+            "pos": values[:, 2].astype(np.int64),
+            "head": row + values[:, 3].astype(np.int64),
+        }
+    )
+    return out
+
+
+def model_version(nlp):
+    """Return a string identifying a loaded model, eg en_core_web_sm-3.0.0."""
+    meta = nlp.meta
+    return f"{meta['lang']}_{meta['name']}-{meta['version']}"
+
+
+class ParseStore:
+    """
+    A store of parsed narratives saved as spaCy DocBins.
+
+    Docs are keyed by row id (eg the accident_df index) and saved in a
+    directory for each model version, so rules can be re-run on stored parses
+    without re-parsing. Each call to add writes a new chunk file.
+
+    Parameters
+    ----------
+    path
+        The directory of the store.
+    model
+        The name of the spaCy model.
+    disable
+        The pipeline components to disable.
+    """
+
+    # token attributes needed to rebuild the tokens, POS tags and dependencies
+    attrs = ("ORTH", "SPACY", "TAG", "POS", "MORPH", "HEAD", "DEP")
+
+    def __init__(self, path, model=DEFAULT_MODEL, disable=UNUSED_COMPONENTS):
+        self.nlp = get_nlp(model, disable)
+        self.version = model_version(self.nlp)
+        self.path = Path(path) / self.version
+        self._docs = None
+
+    @property
+    def docs(self):
+        """A dict of {row_id: Doc} of all stored docs, loaded lazily."""
+        if self._docs is None:
+            self._docs = {}
+            for chunk_path in sorted(self.path.glob("*.spacy")):
+                with chunk_path.with_suffix(".ids").open("rb") as fi:
+                    ids = pickle.load(fi)
+                doc_bin = DocBin().from_disk(chunk_path)
+                self._docs.update(zip(ids, doc_bin.get_docs(self.nlp.vocab)))
+        return self._docs
+
+    def add(self, ids, docs):
+        """Add docs, with their row ids, to the store."""
+        ids, docs = list(ids), list(docs)
+        if not ids:
+            return
+        self.path.mkdir(exist_ok=True, parents=True)
+        chunk_count = len(list(self.path.glob("*.spacy")))
+        chunk_path = self.path / f"{chunk_count:06d}.spacy"
+        DocBin(attrs=list(self.attrs), docs=docs).to_disk(chunk_path)
+        with chunk_path.with_suffix(".ids").open("wb") as fi:
+            pickle.dump(ids, fi)
+        self.docs.update(zip(ids, docs))
+
+    def parse(self, texts, batch_size=256, n_process=1, timer=None):
+        """
+        Return a list of docs for a series of texts, indexed by row id.
+
+        Stored docs are used if their text matches, the others are parsed
+        with nlp.pipe and added to the store. If timer is given the time to
+        parse each batch is recorded as its parse stage.
+        """
+        docs = self.docs
+        is_stored = np.array(
+            [i in docs and docs[i].text == text for i, text in texts.items()],
+            dtype=bool,
+        )
+        missing = texts[~is_stored]
+        kwargs = dict(batch_size=batch_size, n_process=n_process)
+        docs = self.nlp.pipe(missing.values, **kwargs)
+        self.add(missing.index, timed_iter(timer, docs, "parse", batch_size))
+        return [self.docs[i] for i in texts.index]
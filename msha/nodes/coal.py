@@ -18,8 +18,16 @@ from msha.constants import (
     NON_INJURY_DEGREES,
     DEGREE_MAP,
     DEGREE_ORDER,
+    EXPERIENCE_COLUMNS,
     SEVERE_INJURY_DEGREES,
+    STRICTLY_ROCKBURST_WORDS,
 )
+from msha.classifier import get_linked_narratives, train_bump_model
+from msha.evaluation import evaluate_burst_model, score_burst_predictions
+from msha.linkage import link_bumps_to_accidents, link_bumps_to_mines, prepare_bumps
+from msha.sketch import describe_sketches, sketch_by_period
+from msha.text import discriminative_phrases
+from msha.topics import cluster_narratives
 from msha.core import (
     normalize_injuries,
     create_normalizer_df,
@@ -28,9 +36,12 @@ from msha.core import (
     is_ug_coal,
     is_ground_control,
     is_eastern_us,
+    is_in_mines,
     select_k_best_regression,
     aggregate_columns,
     probably_burst,
+    rates_by_mine_class,
+    grouped_rates,
 )
 
 register_matplotlib_converters()
@@ -95,8 +106,7 @@ def get_ug_coal_prod_and_mines(prod_df, mine_df, qbins=4):
     # get a dataframe of just UG coal production
     ug_coal_mines = mine_df[mine_df["is_underground"] & mine_df["is_coal"]]
     df = prod_df[
-        prod_df["mine_id"].isin(ug_coal_mines["mine_id"].unique())
-        & (prod_df["subunit"] == "UNDERGROUND")
+        is_in_mines(prod_df, ug_coal_mines) & (prod_df["subunit"] == "UNDERGROUND")
     ]
     # remove mines with zero employees/production
     df = df[(df["coal_production"] > 0) & (df["employee_count"] > 0)]
@@ -105,11 +115,106 @@ def get_ug_coal_prod_and_mines(prod_df, mine_df, qbins=4):
     return df, ug_coal_mines
 
 
-def get_coal_bump_df(accident_df,):
-    """Plot the number of bumps and bump-related GCIs each year."""
+def aggregate_gc_experience(accident_df, freq="q"):
+    """
+    Aggregate descriptive stats of each experience column of UG coal GC
+    injuries by quarter, with a column level for each experience column.
+    The percentiles are estimated with t-digests (see msha.sketch).
+    """
+    injuries = accident_df[is_ug_gc_accidents(accident_df, only_injuries=True)]
+    sketches = sketch_by_period(injuries, list(EXPERIENCE_COLUMNS), freq=freq)
+    stats = {x: describe_sketches(sketches.get(x, {})) for x in EXPERIENCE_COLUMNS}
+    return pd.concat(stats, axis=1)
+
+
+def get_coal_bump_df(accident_df, cache_path=None, corrections=None, n_process=1):
+    """
+    Get the UG coal GC injuries which were probably caused by bumps.
+
+    If cache_path is given classifications are cached in a SQLite database
+    so only new narratives are classified. corrections is a dict of
+    misspelled burst terms to correct first (see find_narrative_corrections).
+    n_process is the number of processes used for parsing, -1 uses all cores.
+    """
+    injuries = accident_df[is_ug_gc_accidents(accident_df, only_injuries=True)]
+    is_burst = probably_burst(
+        injuries,
+        n_process=n_process,
+        cache_path=cache_path,
+        correct_spelling=corrections or False,
+    )
+    return injuries[is_burst]
+
+
+def evaluate_bump_classifier(accident_df, assumed_bumps, bump_df):
+    """
+    Evaluate the rule and linear bump classifiers on UG coal GC injuries
+    against the manually identified bumps, with a column for each.
+
+    The rules are scored by the predictions of get_coal_bump_df (bump_df) so
+    the narratives aren't parsed again; use evaluate_burst_classifier to
+    benchmark them. The linear model is cross validated so it isn't scored
+    on its training data.
+    """
+    injuries = accident_df[is_ug_gc_accidents(accident_df, only_injuries=True)]
+    rules = score_burst_predictions(injuries, assumed_bumps, bump_df.index)
+    linear = evaluate_burst_model(injuries, assumed_bumps)
+    return pd.concat([rules, linear], axis=1, keys=["rules", "linear"])
+
+
+def train_coal_bump_model(accident_df, assumed_bumps):
+    """
+    Train the linear bump classifier on UG coal GC injuries and the manually
+    identified bumps.
+    """
+    injuries = accident_df[is_ug_gc_accidents(accident_df, only_injuries=True)]
+    return train_bump_model(injuries, assumed_bumps)
+
+
+def mine_bump_phrases(accident_df, assumed_bumps):
+    """
+    Find the phrases which only occur in the narratives of UG coal GC
+    injuries linked to bumps, marking those already in
+    STRICTLY_ROCKBURST_WORDS.
+    """
+    injuries = accident_df[is_ug_gc_accidents(accident_df, only_injuries=True)]
+    narratives, labels = get_linked_narratives(injuries, assumed_bumps)
+    phrases = discriminative_phrases(narratives, labels)
+    return phrases.assign(known=phrases.index.isin(STRICTLY_ROCKBURST_WORDS))
+
+
+def cluster_gc_injuries(accident_df, n_clusters=12):
+    """
+    Cluster the narratives of UG coal GC injuries into mechanism topics,
+    adding an int8 narrative_cluster column.
+    """
+    injuries = accident_df[is_ug_gc_accidents(accident_df, only_injuries=True)]
+    return cluster_narratives(injuries, n_clusters=n_clusters)
+
+
+def aggregate_gc_injury_clusters(clustered_df, freq="q"):
+    """Count the clustered GC injuries of each narrative cluster by quarter."""
+    return aggregate_columns(clustered_df, "narrative_cluster", freq=freq)
+
+
+def link_coal_bumps_to_accidents(accident_df, assumed_bumps, mine_df):
+    """
+    Link the manually identified bumps to UG coal GC injuries, by mine and
+    date, exact narrative or else narrative similarity (blocked by date and
+    the state of the accident's mine).
+    """
     injuries = accident_df[is_ug_gc_accidents(accident_df, only_injuries=True)]
-    bursty_gci = injuries[probably_burst(injuries)]
-    return bursty_gci
+    bumps = prepare_bumps(assumed_bumps)
+    return link_bumps_to_accidents(bumps, injuries, fuzzy=True, mines_df=mine_df)
+
+
+def link_coal_bumps_to_mines(assumed_bumps, mine_df):
+    """
+    Link the manually identified bumps to coal mines, by mine id when known
+    else by mine and company names.
+    """
+    mines = mine_df[mine_df["is_coal"]]
+    return link_bumps_to_mines(prepare_bumps(assumed_bumps), mines)
 
 
 # ----- Plotting functions
@@ -211,53 +316,35 @@ def plot_mining_method(accidents_df):
 
 def plot_region(accident_df, mines_df, production_df):
     """Plot the number of mines and gc accidents by region """
-
-    def _get_regional_accidents(accident_df, mines_df):
-        # get east/west accidents and aggregate
-        mine_ids = mines_df["mine_id"].unique()
-        contains_mines = accident_df["mine_id"].isin(mine_ids)
-        ug_gc = is_ug_coal(accident_df)
-        return accident_df[contains_mines & ug_gc]
-
-    def _get_accident_rate(accident_df, prod_df):
-        """Return a series of accident rates."""
-        common_dates = sorted(set(accident_df.index) & set(prod_df.index))
-        adf, pdf = accident_df.loc[common_dates], prod_df.loc[common_dates]
-        return (adf / pdf["hours_worked"]) * 1_000_000
-
-    colors = ["red", "blue"]
-    is_east = is_eastern_us(mines_df)
-    east_ids = mines_df[is_east]["mine_id"].unique()
-    east_mines = mines_df[mines_df["mine_id"].isin(east_ids)]
-    west_mines = mines_df[~mines_df["mine_id"].isin(east_ids)]
-    # get accidents
-    east = _get_regional_accidents(accident_df, east_mines)
-    west = _get_regional_accidents(accident_df, west_mines)
-    east_gc_coal = aggregate_injuries(east)
-    west_gc_coal = aggregate_injuries(west)
+    colors = {"east": "red", "west": "blue"}
+    region = np.where(is_eastern_us(mines_df), "east", "west")
+    mines_df = mines_df.assign(region=region)
+    # get ug coal injuries and hours worked, then injury rates by region
+    prod, _ = get_ug_coal_prod_and_mines(production_df, mines_df)
+    prod = prod[prod["hours_worked"] > 0]
+    is_injury = accident_df["degree_injury"] != "ACCIDENT ONLY"
+    accidents = accident_df[is_ug_coal(accident_df) & is_injury]
+    rates = grouped_rates(accidents, prod, by=["region"], mines_df=mines_df)
     # init figs
     plt.clf()
     fig, (ax1, ax2, ax3) = plt.subplots(3, 1, figsize=(5.5, 10.5), sharex=True)
-    # plot mines
-    east_prod = aggregate_coal_production(production_df, east_mines)
-    west_prod = aggregate_coal_production(production_df, west_mines)
-    ax1.plot(
-        east_prod.index, east_prod["active_mine_count"], label="east", color=colors[0]
-    )
-    ax1.plot(
-        west_prod.index, west_prod["active_mine_count"], label="west", color=colors[1]
-    )
+    for name, color in colors.items():
+        # plot mines
+        region_mines = mines_df[mines_df["region"] == name]
+        region_prod = aggregate_coal_production(production_df, region_mines)
+        mine_count = region_prod["active_mine_count"]
+        ax1.plot(mine_count.index, mine_count, label=name, color=color)
+        # plot accidents and accident rates, if the region has any
+        if name not in rates.index.get_level_values("region"):
+            continue
+        region_rates = rates.xs(name, level="region")
+        injuries = region_rates["injuries"]
+        ax2.plot(injuries.index, injuries, label=name, color=color)
+        acc_rate = region_rates["injury_rate"]
+        ax3.plot(acc_rate.index, acc_rate, label=name, color=color)
     ax1.set_ylabel("Active UG Coal Mines")
-    # plot accidents
-    ax2.plot(east_gc_coal.index, east_gc_coal, label="east", color=colors[0])
-    ax2.plot(west_gc_coal.index, west_gc_coal, label="west", color=colors[1])
     ax2.set_ylabel("GC Injuries per Quarter")
     ax2.legend()
-    # plot accident rates
-    acc_rate_east = _get_accident_rate(east_gc_coal, east_prod)
-    acc_rate_west = _get_accident_rate(west_gc_coal, west_prod)
-    ax3.plot(acc_rate_east.index, acc_rate_east, label="east", color=colors[0])
-    ax3.plot(acc_rate_west.index, acc_rate_west, label="west", color=colors[1])
     ax3.set_xlabel("year")
     ax3.set_ylabel("GC Injuries per $10^6$ Hours")
     # adjust spacing, tighten
@@ -339,40 +426,19 @@ def plot_accident_rates_by_size(prod_df, mine_df, accidents_df):
     """
     Create a plot of accident rates.
     """
-
-    def _get_mine_year_quarter(df):
-        """Get a columns mine_id_year_qt"""
-        date = df["date"].dt
-        year = date.year.astype(str)
-        # quarter = date.quarter.astype(str)
-        mine_id = df["mine_id"]
-        return mine_id.astype(str) + "." + year
-
     plt.clf()
     fig, ax1 = plt.subplots(1, 1, figsize=(5.5, 3.5),)
-    grouper = pd.Grouper(key="date", freq="y")
     prod_df, mine_df = get_ug_coal_prod_and_mines(prod_df, mine_df)
-    prod_df = prod_df.sort_values("qcount")
-    prod_df["myq"] = _get_mine_year_quarter(prod_df)
     categories = sorted(prod_df["qcount"].unique())
     # get accidents for UG coal where injuries resulted
     con1 = is_ug_gc_accidents(accidents_df)
     con2 = accidents_df["degree_injury"] != "ACCIDENT ONLY"
     acc_df = accidents_df[con1 & con2]
-    acc_df["myq"] = _get_mine_year_quarter(acc_df)
-    # first create a dict of categories and prod
-    cat = {}
-    for category, sub_prod in prod_df.groupby("qcount"):
-        cat[category] = sub_prod
+    rates = rates_by_mine_class(prod_df, acc_df, "qcount")
     # now iterate categories, starting with the largest, and plot
-    for category in sorted(cat, reverse=True):
-        sub_prod = cat[category]
-        # get injuries associated with this group
+    for category in sorted(rates.columns, reverse=True):
         label = get_label_size_label(category, categories)
-        df = acc_df[acc_df["myq"].isin(sub_prod["myq"].unique())]
-        injuries = df.groupby(grouper).size()
-        hours = sub_prod.groupby(grouper)["hours_worked"].sum()
-        out = (injuries / hours).fillna(0) * 1_000_000
+        out = rates[category]
         ax1.plot(out.index, out, label=label)
 
     handles, labels = ax1.get_legend_handles_labels()
@@ -428,8 +494,10 @@ def plot_predicted_injury_rates(prod_df, accident_df, mines_df):
     norm = normed.loc[feature_df.index]
     # get GC injury rate (injuries per 10^6 hours)
     target = norm["hours_worked"] * 1_000_000
-    # select the most important features
-    select_feats = select_k_best_regression(feature_df, target, k=5, normalize=True,)
+    # select the most important features by out of sample (rolling origin) error
+    select_feats, cv_mae = select_k_best_regression(
+        feature_df, target, k=5, cv=5, return_scores=True, normalize=True,
+    )
     X = select_feats.values
     reg = LinearRegression(normalize=True).fit(X, target.values)
     x_pred = reg.predict(X)
@@ -438,7 +506,8 @@ def plot_predicted_injury_rates(prod_df, accident_df, mines_df):
     # now plot
     plt.figure(figsize=(5.5, 3.5))
     plt.plot(target.index, target.values, color="b", label="GC injury rate")
-    plt.plot(select_feats.index, x_pred, color="r", label="predicted injury rate")
+    label = f"predicted injury rate (CV MAE {cv_mae.iloc[-1]:.2f})"
+    plt.plot(select_feats.index, x_pred, color="r", label=label)
     plt.legend()
     plt.xlabel("Year")
     plt.ylabel("GC Injures per $10^6$ Hours")
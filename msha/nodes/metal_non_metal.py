@@ -9,7 +9,10 @@ from msha.constants import NON_INJURY_DEGREES
 from msha.core import (
     normalize_injuries,
     create_normalizer_df,
-    current_year
+    current_year,
+    grouped_rates,
+    is_in_mines,
+    take_mine_attribute,
 )
 from pandas.plotting import register_matplotlib_converters
 
@@ -23,18 +26,17 @@ def get_ug_mnm_mines(mines, prod_df):
     con2 = mines["current_mine_type"] == "Underground"
     mnm_mines = mines[con1 & con2]
     # get minew which have some reported hours worked
-    prod_con1 = prod_df["mine_id"].isin(mnm_mines["mine_id"])
+    prod_con1 = is_in_mines(prod_df, mnm_mines)
     is_underground = prod_df["subunit"] == "UNDERGROUND"
-    sub_prod = prod_df[prod_con1 & is_underground]
-    prod_gb = sub_prod.groupby("mine_id")
-    has_hours = prod_gb["hours_worked"].sum() > 0
-    out = mnm_mines[mnm_mines["mine_id"].isin(has_hours.index)]
+    has_hours = prod_df["hours_worked"] > 0
+    sub_prod = prod_df[prod_con1 & is_underground & has_hours]
+    out = mnm_mines[is_in_mines(mnm_mines, sub_prod)]
     return out
 
 
 def get_ug_mnm_prod(prod, mines):
     """Return production and mine dfs that are UG metal/non-metal"""
-    con1 = prod["mine_id"].isin(mines["mine_id"])
+    con1 = is_in_mines(prod, mines)
     con2 = prod["subunit"] == "UNDERGROUND"
     # ensure some hours were worked
     con3 = (prod["hours_worked"] > 0) | (prod["employee_count"] > 0)
@@ -44,7 +46,7 @@ def get_ug_mnm_prod(prod, mines):
 def get_ug_mnm_gc_injury(accidents, mines):
     """Return a dataframe of injuries in mnm underground mines. """
     # first filter to mines
-    con1 = accidents["mine_id"].isin(mines["mine_id"])
+    con1 = is_in_mines(accidents, mines)
     con2 = accidents["is_underground"]
     con3 = ~accidents["degree_injury"].isin(NON_INJURY_DEGREES)
     con4 = accidents["classification"].isin(GROUND_CONTROL_CLASSIFICATIONS)
@@ -119,10 +121,20 @@ def plot_injuries_by_commodity(production, accidents, mines, gold_price):
     mnm_mines = get_ug_mnm_mines(mines, production)
     prod = get_ug_mnm_prod(production, mnm_mines)
     injuries = get_ug_mnm_gc_injury(accidents, mnm_mines)
-    # join commodity to injury
+    # join commodity to production
     comod = mnm_mines[["mine_id", "primary_canvass"]]
-    inj_with_comod = pd.merge(injuries, comod, on="mine_id")
-    prod_with_comod = pd.merge(prod, comod, on="mine_id")
+    prod_with_comod = prod.assign(
+        primary_canvass=take_mine_attribute(prod, mnm_mines, "primary_canvass")
+    )
+    # get yearly injuries for all commodities
+    rates = grouped_rates(
+        injuries[injuries["date"] < "2020-01-01"],
+        prod,
+        by=["primary_canvass"],
+        freq="Y",
+        mines_df=mnm_mines,
+    )
+    inj_counts = rates["injuries"].unstack(fill_value=0)
 
     grouper = pd.Grouper(key="date", freq="Y")
     # now init mine count plot and injury plot
@@ -130,17 +142,15 @@ def plot_injuries_by_commodity(production, accidents, mines, gold_price):
     for comod_name in comod["primary_canvass"].unique():
         if comod_name == "nan" or pd.isnull(comod_name):
             continue
-        inj = inj_with_comod[inj_with_comod["primary_canvass"] == comod_name]
-        inj = inj[inj["date"] < "2020-01-01"]
         pro = prod_with_comod[prod_with_comod["primary_canvass"] == comod_name]
         # remoce duplicate mine entries for each year
         pro["year"] = pro["date"].dt.year
         pro = pro.drop_duplicates(["year", "mine_id"])
-        mine_count = pro.groupby(grouper).size()
         miner_count = pro.groupby(grouper)["employee_count"].sum()
-        inj_count = inj.groupby(grouper).size()
         ax2.plot(miner_count.index, miner_count.values, label=comod_name)
-        ax1.plot(inj_count.index, inj_count.values, label=comod_name)
+        if comod_name in inj_counts.columns:
+            inj_count = inj_counts[comod_name]
+            ax1.plot(inj_count.index, inj_count.values, label=comod_name)
 
     ax2.set_xlabel("Year")
     ax2.set_ylabel("UG MNM Miners")
@@ -154,10 +164,17 @@ def plot_injuries_by_commodity(production, accidents, mines, gold_price):
 def plot_by_state(production, mines, accidents, num_states=6):
     """Plot a yearly histogram of miners by state. """
 
+    def _with_canvass_and_state(df, mnm_mines):
+        """Attach the primary canvass and state of each row's mine."""
+        assignments = {
+            col: take_mine_attribute(df, mnm_mines, col)
+            for col in ["primary_canvass", "state"]
+        }
+        return df.assign(**assignments)
+
     def get_injuries_and_employees_per_year(mnm_mines, prod, injuries):
         """Get employees and injuries by state."""
-        comod = mnm_mines[["mine_id", "primary_canvass", "state"]]
-        prod_with_comod = pd.merge(prod.drop(columns="state"), comod, on="mine_id")
+        prod_with_comod = _with_canvass_and_state(prod, mnm_mines)
         prod_with_comod["year"] = prod_with_comod["date"].dt.year
         gcols = ["primary_canvass", "year", "state"]
 
@@ -167,21 +184,18 @@ def plot_by_state(production, mines, accidents, num_states=6):
         employee_count = emp_count_year.groupby(gcols)["employee_count"].sum().round()
         employee_count /= 1000.
 
-        hrs_worked = gr["hours_worked"].mean().reset_index()
-        hrs_worked_year = hrs_worked.groupby(gcols)["hours_worked"].sum().round()
-
-        # now get injuries
-        injs = pd.merge(injuries, comod, on="mine_id")
-        injs["year"] = injs["date"].dt.year
-        inj_df = injs.groupby(gcols).size()
-        inj_df.name = "injuries"
-
-        out = (
-            pd.concat([inj_df, employee_count, hrs_worked_year], axis=1)
-            .fillna(0)
-            .reset_index()
-        )
-        out["injury_rate"] = (out["injuries"] / out["hours_worked"]) * 1_000_000
+        # now get injuries and injury rates
+        rates = grouped_rates(
+            injuries,
+            prod,
+            by=["primary_canvass", "state"],
+            freq="Y",
+            mines_df=mnm_mines,
+        ).reset_index()
+        rates["year"] = rates.pop("date").dt.year
+        rates = rates.set_index(gcols)
+
+        out = pd.concat([rates, employee_count], axis=1).fillna(0).reset_index()
         out = out[out['year'] < current_year]
         return out
 
@@ -2,8 +2,13 @@
 Nodes for simple pre-processing.
 """
 
+import numpy as np
 import pandas as pd
 
+from msha.search import NarrativeIndex
+from msha.similarity import SimilarityIndex
+from msha.spelling import find_corrections
+
 # --- Utils
 
 # A mapping of column names to new names. If None just lowercase name.
@@ -38,6 +43,8 @@ COLUMN_MAP = {
     "CURRENT_STATUS_DT": "last_updated",
     "STATE": "state",
     "CURRENT_CONTROLLER_BEGIN_DT": "controller_start",
+    "CURRENT_CONTROLLER_NAME": "controller_name",
+    "CURRENT_OPERATOR_NAME": "operator_name",
     "PRIMARY_CANVASS": None,
     "SECONDAY_CANVASS": None,
     "NO_EMPLOYEES": "employee_count",
@@ -65,10 +72,28 @@ def drop_upper_case(df):
     return df.drop(columns=upper_cols)
 
 
+def add_mine_index(df, mines=None):
+    """
+    Add a dense int32 column, mine_idx, with each row's position in the mines table.
+
+    If mines is None the mine_ids of df are factorized (this is how the mine
+    dimension is created from the mines table). Otherwise mine_ids are looked
+    up in the mine_idx of mines, and rows with unknown mines get -1.
+    """
+    if mines is None:
+        codes, _ = pd.factorize(df["mine_id"])
+        return df.assign(mine_idx=codes.astype(np.int32))
+    dimension = pd.Series(mines["mine_idx"].values, index=mines["mine_id"].values)
+    dimension = dimension[~dimension.index.duplicated()]
+    positions = dimension.index.get_indexer(df["mine_id"])
+    mine_idx = np.where(positions >= 0, dimension.values.take(positions), -1)
+    return df.assign(mine_idx=mine_idx.astype(np.int32))
+
+
 # --- Node functions
 
 
-def preproc_accidents(df: pd.DataFrame) -> pd.DataFrame:
+def preproc_accidents(df: pd.DataFrame, mines: pd.DataFrame = None) -> pd.DataFrame:
     """
     Preprocessing for accidents.
     """
@@ -78,6 +103,8 @@ def preproc_accidents(df: pd.DataFrame) -> pd.DataFrame:
         .pipe(rename)
         .pipe(drop_upper_case)
     )
+    if mines is not None:
+        out = add_mine_index(out, mines)
     return out
 
 
@@ -90,11 +117,16 @@ def preproce_mines(df: pd.DataFrame) -> pd.DataFrame:
         is_coal=df["PRIMARY_CANVASS"] == "Coal",
         is_metal=df["PRIMARY_CANVASS"] == "Metal",
     )
-    out = df.assign(**assignments).pipe(rename).pipe(drop_upper_case)
+    out = (
+        df.assign(**assignments)
+        .pipe(rename)
+        .pipe(drop_upper_case)
+        .pipe(add_mine_index)
+    )
     return out
 
 
-def preproce_production(df: pd.DataFrame) -> pd.DataFrame:
+def preproce_production(df: pd.DataFrame, mines: pd.DataFrame = None) -> pd.DataFrame:
     """Preprocessing for production."""
 
     def _add_production_date(df):
@@ -103,7 +135,28 @@ def preproce_production(df: pd.DataFrame) -> pd.DataFrame:
         df["date"] = pd.to_datetime(dst)
         return df
 
-    return df.pipe(_add_production_date).pipe(rename).pipe(drop_upper_case)
+    out = df.pipe(_add_production_date).pipe(rename).pipe(drop_upper_case)
+    if mines is not None:
+        out = add_mine_index(out, mines)
+    return out
+
+
+def index_narratives(df: pd.DataFrame) -> NarrativeIndex:
+    """Build an inverted index of the accident narratives for phrase search."""
+    return NarrativeIndex.from_narratives(df["narrative"])
+
+
+def index_narrative_similarity(df: pd.DataFrame) -> SimilarityIndex:
+    """Build an approximate nearest neighbor index of the accident narratives."""
+    return SimilarityIndex.from_narratives(df["narrative"])
+
+
+def find_narrative_corrections(df: pd.DataFrame) -> dict:
+    """
+    Find the corrections of misspelled burst terms over all the narratives,
+    these can be passed to probably_burst as correct_spelling.
+    """
+    return find_corrections(df["narrative"].fillna("").astype(str).values)
 
 
 def download_definition_functions():
@@ -56,11 +56,64 @@ nodes = [
         outputs="injury_severity",
         inputs=["pp_production", "pp_accidents", "pp_mines"],
     ),
+    node(
+        coal.aggregate_gc_experience,
+        name="aggregate_gc_experience",
+        outputs="coal_gc_experience_df",
+        inputs="pp_accidents",
+    ),
     node(
         coal.get_coal_bump_df,
         name="get_coal_bump_df",
         outputs="coal_bump_injuries",
-        inputs=["pp_accidents"],
+        inputs=[
+            "pp_accidents",
+            "params:burst_cache_path",
+            "narrative_corrections",
+            "params:burst_n_process",
+        ],
+    ),
+    node(
+        coal.evaluate_bump_classifier,
+        name="evaluate_bump_classifier",
+        outputs="bump_classifier_evaluation",
+        inputs=["pp_accidents", "coal_assumed_bump_df", "coal_bump_injuries"],
+    ),
+    node(
+        coal.train_coal_bump_model,
+        name="train_coal_bump_model",
+        outputs="coal_bump_model",
+        inputs=["pp_accidents", "coal_assumed_bump_df"],
+    ),
+    node(
+        coal.cluster_gc_injuries,
+        name="cluster_gc_injuries",
+        outputs="coal_gc_injury_clusters",
+        inputs="pp_accidents",
+    ),
+    node(
+        coal.aggregate_gc_injury_clusters,
+        name="aggregate_gc_injury_clusters",
+        outputs="coal_gc_injury_cluster_counts",
+        inputs="coal_gc_injury_clusters",
+    ),
+    node(
+        coal.mine_bump_phrases,
+        name="mine_bump_phrases",
+        outputs="bump_phrases",
+        inputs=["pp_accidents", "coal_assumed_bump_df"],
+    ),
+    node(
+        coal.link_coal_bumps_to_accidents,
+        name="link_coal_bumps_to_accidents",
+        outputs="coal_bump_accidents",
+        inputs=["pp_accidents", "coal_assumed_bump_df", "pp_mines"],
+    ),
+    node(
+        coal.link_coal_bumps_to_mines,
+        name="link_coal_bumps_to_mines",
+        outputs="coal_bump_mines",
+        inputs=["coal_assumed_bump_df", "pp_mines"],
     ),
     node(
         coal.plot_coal_bumps,
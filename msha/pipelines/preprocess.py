@@ -9,6 +9,9 @@ from msha.nodes.preprocess import (
     preproce_mines,
     preproce_production,
     download_definition_functions,
+    find_narrative_corrections,
+    index_narratives,
+    index_narrative_similarity,
 )
 
 
@@ -41,7 +44,7 @@ def create_pipeline(**kwargs):
             ),
             node(
                 func=preproc_accidents,
-                inputs="msha_accidents",
+                inputs=["msha_accidents", "pp_mines"],
                 outputs="pp_accidents",
                 name="pp_accidents",
             ),
@@ -53,9 +56,27 @@ def create_pipeline(**kwargs):
             ),
             node(
                 func=preproce_production,
-                inputs="msha_production",
+                inputs=["msha_production", "pp_mines"],
                 outputs="pp_production",
                 name="pp_production",
             ),
+            node(
+                func=index_narratives,
+                inputs="pp_accidents",
+                outputs="narrative_index",
+                name="narrative_index",
+            ),
+            node(
+                func=index_narrative_similarity,
+                inputs="pp_accidents",
+                outputs="similarity_index",
+                name="similarity_index",
+            ),
+            node(
+                func=find_narrative_corrections,
+                inputs="pp_accidents",
+                outputs="narrative_corrections",
+                name="narrative_corrections",
+            ),
         ]
     )
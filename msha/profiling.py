@@ -0,0 +1,86 @@
+"""
+Optional timing instrumentation for multi-stage computations.
+"""
+import time
+from contextlib import contextmanager, nullcontext
+from itertools import islice
+
+import numpy as np
+import pandas as pd
+
+
+class StageTimer:
+    """
+    Record the latencies of named stages.
+
+    Each call to time (or each item or batch of iter) records one latency,
+    so the latencies of a stage can be summarized or binned into a histogram.
+    """
+
+    def __init__(self):
+        self.latencies = {}
+
+    def record(self, stage, seconds):
+        """Record a latency (in seconds) for a stage."""
+        self.latencies.setdefault(stage, []).append(seconds)
+
+    @contextmanager
+    def time(self, stage):
+        """A context manager which records the time spent in its block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def iter(self, iterable, stage, batch_size=1):
+        """
+        Yield from iterable recording the time taken to produce each item,
+        or each batch of batch_size items.
+        """
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            batch = list(islice(iterator, batch_size))
+            if batch:
+                self.record(stage, time.perf_counter() - start)
+            yield from batch
+            if len(batch) < batch_size:
+                return
+
+    def histogram(self, stage, bins=10):
+        """Return the counts and bin edges of the latencies of a stage."""
+        return np.histogram(self.latencies.get(stage, []), bins=bins)
+
+    def summary(self):
+        """
+        Return a dataframe indexed by stage with the number of latencies,
+        their total, mean, median, 95th percentile and max (in seconds).
+        """
+        rows = {}
+        for stage, latencies in self.latencies.items():
+            latencies = np.asarray(latencies)
+            rows[stage] = dict(
+                count=len(latencies),
+                total=latencies.sum(),
+                mean=latencies.mean(),
+                median=np.median(latencies),
+                p95=np.percentile(latencies, 95),
+                max=latencies.max(),
+            )
+        columns = ["count", "total", "mean", "median", "p95", "max"]
+        out = pd.DataFrame.from_dict(rows, orient="index", columns=columns)
+        out.index.name = "stage"
+        return out
+
+
+def timed(timer, stage):
+    """Time a block with timer, or do nothing if timer is None."""
+    return nullcontext() if timer is None else timer.time(stage)
+
+
+def timed_iter(timer, iterable, stage, batch_size=1):
+    """Time the batches of iterable with timer, or do nothing if it is None."""
+    if timer is None:
+        return iterable
+    return timer.iter(iterable, stage, batch_size=batch_size)
@@ -0,0 +1,180 @@
+"""
+An inverted index of accident narratives for fast phrase search.
+"""
+import re
+from functools import reduce
+from itertools import chain
+from operator import iand, ior
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# the tokens which are indexed; punctuation is ignored
+TOKEN_REGEX = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    """Split text into lower case alphanumeric tokens."""
+    if not isinstance(text, str):
+        return []
+    return TOKEN_REGEX.findall(text.lower())
+
+
+class NarrativeIndex:
+    """
+    An inverted index mapping each narrative token to its postings.
+
+    The postings of each term are the rows (positions in the indexed
+    dataframe) and token positions it occurs at, stored in flat arrays
+    sorted by term so a lookup is a dictionary access and two slices.
+
+    Parameters
+    ----------
+    terms
+        An array of the unique terms.
+    offsets
+        The start of each term's postings, with a final end offset.
+    rows
+        The row of each posting.
+    positions
+        The token position of each posting.
+    index
+        The index labels of the indexed dataframe.
+    """
+
+    def __init__(self, terms, offsets, rows, positions, index):
+        self.terms = np.asarray(terms, dtype=object)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.rows = np.asarray(rows, dtype=np.int32)
+        self.positions = np.asarray(positions, dtype=np.int32)
+        self.index = pd.Index(index)
+        self._term_ids = {term: num for num, term in enumerate(self.terms)}
+        # postings are encoded as row * stride + position for phrase queries
+        self._stride = np.int64(self.positions.max(initial=0)) + 2
+
+    @classmethod
+    def from_narratives(cls, narratives):
+        """Build an index from a series of narratives."""
+        tokens = [tokenize(x) for x in narratives]
+        lengths = np.fromiter((len(x) for x in tokens), np.int64, len(tokens))
+        flat = np.fromiter(chain.from_iterable(tokens), object, lengths.sum())
+        codes, terms = pd.factorize(flat)
+        rows = np.repeat(np.arange(len(tokens)), lengths)
+        starts = np.repeat(np.cumsum(lengths) - lengths, lengths)
+        positions = np.arange(len(codes)) - starts
+        # sort postings by term then row and position
+        order = np.argsort(codes, kind="stable")
+        counts = np.bincount(codes, minlength=len(terms))
+        offsets = np.concatenate([[0], np.cumsum(counts)])
+        return cls(terms, offsets, rows[order], positions[order], narratives.index)
+
+    def __len__(self):
+        return len(self.index)
+
+    def __repr__(self):
+        return f"NarrativeIndex(narratives={len(self)}, terms={len(self.terms)})"
+
+    def postings(self, term):
+        """Return the rows and positions of a term."""
+        num = self._term_ids.get(term)
+        if num is None:
+            return np.empty(0, np.int32), np.empty(0, np.int32)
+        start, stop = self.offsets[num], self.offsets[num + 1]
+        return self.rows[start:stop], self.positions[start:stop]
+
+    def phrase_rows(self, phrase):
+        """Return a sorted array of the rows which contain a phrase."""
+        tokens = tokenize(phrase)
+        if not tokens:
+            return np.empty(0, np.int64)
+        # encode each posting as a single int so phrases are set intersections
+        stride = self._stride
+        rows, positions = self.postings(tokens[0])
+        keys = rows.astype(np.int64) * stride + positions
+        for offset, token in enumerate(tokens[1:], 1):
+            rows, positions = self.postings(token)
+            next_keys = rows.astype(np.int64) * stride + positions - offset
+            keys = keys[np.isin(keys, next_keys, assume_unique=True)]
+        return np.unique(keys // stride)
+
+    def contains(self, phrase):
+        """Return a bool array indicating which narratives contain a phrase."""
+        out = np.zeros(len(self), dtype=bool)
+        out[self.phrase_rows(phrase)] = True
+        return out
+
+    def save(self, path):
+        """Save the index to a npz file."""
+        np.savez_compressed(
+            Path(path),
+            terms=self.terms.astype(str),
+            offsets=self.offsets,
+            rows=self.rows,
+            positions=self.positions,
+            index=self.index.values,
+        )
+
+    @classmethod
+    def load(cls, path):
+        """Load an index saved with save."""
+        with np.load(Path(path), allow_pickle=True) as data:
+            return cls(**{x: data[x] for x in data.files})
+
+
+def _align_filter(index, mask):
+    """
+    Return a filter as a bool array in the row order of index; series are
+    aligned by label, arrays must already be in row order.
+    """
+    if isinstance(mask, pd.Series) and not mask.index.equals(index.index):
+        if not mask.index.is_unique or not index.index.isin(mask.index).all():
+            msg = "filter series must have a unique label for every narrative"
+            raise ValueError(msg)
+        mask = mask.reindex(index.index)
+    mask = np.asarray(mask, dtype=bool)
+    if mask.shape != (len(index),):
+        msg = f"filter has shape {mask.shape}, expected ({len(index)},)"
+        raise ValueError(msg)
+    return mask
+
+
+def search_narratives(index, phrases, how="any", exclude=(), filters=()):
+    """
+    Find the narratives which contain phrases.
+
+    Parameters
+    ----------
+    index
+        A NarrativeIndex.
+    phrases
+        A phrase or a sequence of phrases. Phrases match whole tokens, in
+        order, ignoring case and punctuation.
+    how
+        "any" to match narratives with any of the phrases or "all" to
+        only match narratives with every phrase.
+    exclude
+        Phrases which must not be in matching narratives.
+    filters
+        A bool series (aligned by label) or array (in the indexed order),
+        eg the output of is_ug_gc_accidents, or a sequence of them, which
+        must also be True.
+
+    Returns
+    -------
+    A bool series with the index of the indexed narratives.
+    """
+    if how not in {"any", "all"}:
+        raise ValueError(f"how must be 'any' or 'all' not {how}")
+    phrases = [phrases] if isinstance(phrases, str) else list(phrases)
+    exclude = [exclude] if isinstance(exclude, str) else list(exclude)
+    if isinstance(filters, (pd.Series, np.ndarray)):
+        filters = [filters]
+    combine, start = (ior, False) if how == "any" else (iand, True)
+    matches = [index.contains(x) for x in phrases]
+    out = reduce(combine, matches, np.full(len(index), start))
+    for phrase in exclude:
+        out &= ~index.contains(phrase)
+    for mask in filters:
+        out &= _align_filter(index, mask)
+    return pd.Series(out, index=index.index)
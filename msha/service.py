@@ -0,0 +1,266 @@
+"""
+A local HTTP service which classifies narratives in micro-batches.
+"""
+import json
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+from msha.core import classify_bursts
+from msha.nlp import warm_worker
+
+logger = logging.getLogger(__name__)
+
+
+def classify_texts(texts):
+    """Classify a list of narrative strings, return a list of bools."""
+    return classify_bursts(pd.Series(texts, dtype=object)).tolist()
+
+
+class MicroBatcher:
+    """
+    Coalesce concurrent classification requests into batches.
+
+    A worker thread waits for the first queued narrative, then collects more
+    for up to max_wait seconds (or until max_batch_size) and classifies them
+    together, so spaCy parses concurrent requests with one nlp.pipe call.
+
+    Parameters
+    ----------
+    classify
+        A function which takes a list of narratives and returns a list of
+        results.
+    max_batch_size
+        The largest number of narratives classified together.
+    max_wait
+        The longest time (in seconds) a narrative waits for others to join
+        its batch.
+    history
+        The number of recent requests kept for latency percentiles.
+    """
+
+    def __init__(
+        self, classify=classify_texts, max_batch_size=64, max_wait=0.01, history=10_000
+    ):
+        self.classify = classify
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._latencies = deque(maxlen=history)
+        self._batch_sizes = deque(maxlen=history)
+        self._lock = threading.Lock()
+        self._completed = 0
+        self._started = time.perf_counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, narrative):
+        """Queue a narrative, return a Future of its result."""
+        future = Future()
+        self._queue.put((narrative, future, time.perf_counter()))
+        return future
+
+    def classify_many(self, narratives, timeout=None):
+        """
+        Classify narratives through the batcher, blocking for the results
+        for at most timeout seconds (if given) in total.
+        """
+        futures = [self.submit(x) for x in narratives]
+        if timeout is None:
+            return [x.result() for x in futures]
+        deadline = time.perf_counter() + timeout
+        return [x.result(timeout=deadline - time.perf_counter()) for x in futures]
+
+    def _next_batch(self):
+        """Block for a narrative then collect others until full or timed out."""
+        try:
+            batch = [self._queue.get(timeout=0.1)]
+        except queue.Empty:
+            return []
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self._queue.get(timeout=max(remaining, 0)))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not self._stopped.is_set():
+            batch = self._next_batch()
+            if not batch:
+                continue
+            narratives, futures, starts = zip(*batch)
+            try:
+                results = self.classify(list(narratives))
+            except Exception as e:  # pass errors on to the callers
+                logger.exception("classifying a batch failed")
+                for future in futures:
+                    future.set_exception(e)
+                continue
+            done = time.perf_counter()
+            for future, result in zip(futures, results):
+                future.set_result(result)
+            with self._lock:
+                self._latencies.extend(done - x for x in starts)
+                self._batch_sizes.append(len(batch))
+                self._completed += len(batch)
+
+    def metrics(self):
+        """
+        Return a dict of the completed requests, throughput (requests per
+        second since the batcher started), p50/p99 latency (in seconds) and
+        mean batch size of recent requests.
+        """
+        with self._lock:
+            latencies = np.array(self._latencies)
+            batch_sizes = np.array(self._batch_sizes)
+            completed = self._completed
+        elapsed = time.perf_counter() - self._started
+        has_data = len(latencies) > 0
+        return dict(
+            completed=completed,
+            throughput=completed / elapsed if elapsed else 0.0,
+            p50_latency=float(np.percentile(latencies, 50)) if has_data else None,
+            p99_latency=float(np.percentile(latencies, 99)) if has_data else None,
+            mean_batch_size=float(batch_sizes.mean()) if has_data else None,
+        )
+
+    def close(self):
+        """Stop the worker thread."""
+        self._stopped.set()
+        self._thread.join()
+
+
+def _parse_request(request):
+    """
+    Return the narratives of a request body and whether it had a single
+    narrative, raise a ValueError if it isn't {"narrative": str} or
+    {"narratives": [str, ...]}.
+    """
+    if not isinstance(request, dict):
+        raise ValueError("expected a JSON object")
+    if "narrative" in request:
+        if not isinstance(request["narrative"], str):
+            raise ValueError("narrative must be a string")
+        return [request["narrative"]], True
+    narratives = request.get("narratives")
+    if not isinstance(narratives, list):
+        raise ValueError("expected narrative (a string) or narratives (a list)")
+    if not all(isinstance(x, str) for x in narratives):
+        raise ValueError("narratives must be strings")
+    return narratives, False
+
+
+class ClassificationHandler(BaseHTTPRequestHandler):
+    """
+    Handle POST /classify with {"narratives": [...]} (or {"narrative": ...})
+    and GET /metrics and /health.
+    """
+
+    def _send_json(self, obj, status=200):
+        body = json.dumps(obj).encode("utf8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            self._send_json(self.server.batcher.metrics())
+        elif self.path == "/health":
+            self._send_json({"status": "ok"})
+        else:
+            self._send_json({"error": f"unknown path {self.path}"}, status=404)
+
+    def do_POST(self):
+        if self.path != "/classify":
+            self._send_json({"error": f"unknown path {self.path}"}, status=404)
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            narratives, single = _parse_request(json.loads(self.rfile.read(length)))
+        except ValueError as e:
+            self._send_json({"error": f"bad request: {e}"}, status=400)
+            return
+        try:
+            results = self.server.batcher.classify_many(
+                narratives, timeout=self.server.timeout_seconds
+            )
+        except FutureTimeout:
+            self._send_json({"error": "classification timed out"}, status=504)
+            return
+        except Exception as e:  # the batcher has logged the traceback
+            self._send_json({"error": f"classification failed: {e}"}, status=500)
+            return
+        if single:
+            self._send_json({"burst": results[0]})
+        else:
+            self._send_json({"bursts": results})
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+class ClassificationServer(ThreadingHTTPServer):
+    """A threading HTTP server which accepts many concurrent connections."""
+
+    daemon_threads = True
+    request_queue_size = 128
+    # the longest time (in seconds) a request waits for its results
+    timeout_seconds = 60
+
+
+def make_server(host="127.0.0.1", port=0, warm=True, timeout=60, **kwargs):
+    """
+    Create the classification server; call serve_forever to run it.
+
+    Parameters
+    ----------
+    host
+        The host to bind, localhost by default.
+    port
+        The port to bind, 0 picks a free port (see server.server_address).
+    warm
+        If True load the spaCy model now rather than on the first request.
+    timeout
+        The longest time (in seconds) a request waits for its results
+        before a 504 response.
+
+    kwargs are passed to MicroBatcher.
+    """
+    if warm:
+        warm_worker()
+    server = ClassificationServer((host, port), ClassificationHandler)
+    server.timeout_seconds = timeout
+    server.batcher = MicroBatcher(**kwargs)
+    return server
+
+
+def serve(host="127.0.0.1", port=8765, **kwargs):
+    """Run the classification server until interrupted."""
+    server = make_server(host, port, **kwargs)
+    logger.info(f"classifying narratives at http://{host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.batcher.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    serve()
@@ -0,0 +1,174 @@
+"""
+Approximate nearest neighbor search for similar accident narratives.
+"""
+import numpy as np
+import pandas as pd
+from sklearn.feature_extraction.text import TfidfTransformer
+from sklearn.pipeline import make_pipeline
+from sklearn.random_projection import SparseRandomProjection
+
+from msha.text import make_hashing_vectorizer
+
+
+def make_narrative_embedder(n_features=2 ** 18, ngram_range=(1, 1)):
+    """
+    Create a pipeline which embeds narratives as tf-idf weighted, l2
+    normalized hashed n-gram vectors (fit it to learn the idf weights).
+    """
+    return make_pipeline(
+        make_hashing_vectorizer(
+            n_features=n_features, ngram_range=ngram_range, norm=None
+        ),
+        TfidfTransformer(sublinear_tf=True),
+    )
+
+
+class SimilarityIndex:
+    """
+    A random projection LSH index of narrative vectors.
+
+    Each of n_tables hash tables keys a vector by the signs of n_bits random
+    projections (a SimHash), so vectors with a small angle between them
+    usually share a key. Queries probe the bucket of the query's key, and
+    the buckets one bit away, in every table then rank the candidates by
+    their exact cosine similarity.
+
+    Parameters
+    ----------
+    vectors
+        A sparse matrix of l2 normalized vectors, one row per narrative.
+    index
+        The index labels of the narratives.
+    embedder
+        The fitted embedder which made the vectors, used to embed new text.
+    n_bits
+        The number of bits of each key.
+    n_tables
+        The number of hash tables.
+    seed
+        The random seed of the projections.
+    """
+
+    def __init__(
+        self, vectors, index, embedder=None, n_bits=12, n_tables=16, seed=42
+    ):
+        self.vectors = vectors.tocsr().astype(np.float32)
+        self.index = pd.Index(index)
+        self.embedder = embedder
+        self.n_bits = n_bits
+        self.n_tables = n_tables
+        projection = SparseRandomProjection(
+            n_components=n_bits * n_tables,
+            density=0.1,  # dense enough that short narratives rarely project to 0
+            random_state=seed,
+        ).fit(self.vectors[:1])
+        # transposed once here rather than on every query
+        self.projection = projection.components_.T.tocsr().astype(np.float32)
+        keys = self._keys(self.vectors)
+        self._order = np.argsort(keys, axis=0, kind="stable")
+        self._sorted_keys = np.take_along_axis(keys, self._order, axis=0)
+
+    @classmethod
+    def from_narratives(cls, narratives, n_features=2 ** 18, **kwargs):
+        """
+        Embed a series of narratives and index them.
+
+        kwargs are passed to SimilarityIndex.
+        """
+        embedder = make_narrative_embedder(n_features=n_features)
+        texts = narratives.fillna("").astype(str).values
+        vectors = embedder.fit_transform(texts)
+        return cls(vectors, narratives.index, embedder=embedder, **kwargs)
+
+    def __len__(self):
+        return len(self.index)
+
+    def __repr__(self):
+        return (
+            f"SimilarityIndex(narratives={len(self)}, n_bits={self.n_bits}, "
+            f"n_tables={self.n_tables})"
+        )
+
+    def _keys(self, vectors):
+        """Return the key of each vector in each table, shape (n, n_tables)."""
+        signs = (vectors @ self.projection).toarray() > 0
+        signs = signs.reshape(-1, self.n_tables, self.n_bits)
+        return signs.astype(np.int64) @ (1 << np.arange(self.n_bits))
+
+    def _candidates(self, vector):
+        """Return the rows in the probed buckets of every table."""
+        keys = self._keys(vector)[0]
+        # probe the key and the keys one bit away from it
+        flips = np.concatenate([[0], 1 << np.arange(self.n_bits)])
+        out = []
+        for table, key in enumerate(keys):
+            probes = key ^ flips
+            sorted_keys = self._sorted_keys[:, table]
+            starts = np.searchsorted(sorted_keys, probes, side="left")
+            stops = np.searchsorted(sorted_keys, probes, side="right")
+            for start, stop in zip(starts, stops):
+                out.append(self._order[start:stop, table])
+        return np.unique(np.concatenate(out))
+
+    def query(self, vector, k=10, exclude=None):
+        """
+        Find the most similar narratives to a vector.
+
+        Parameters
+        ----------
+        vector
+            A sparse (1, n_features) l2 normalized vector.
+        k
+            The number of results.
+        exclude
+            An optional row number to leave out of the results.
+
+        Returns
+        -------
+        A series of cosine similarities indexed by narrative index labels,
+        most similar first.
+        """
+        rows = self._candidates(vector)
+        if exclude is not None:
+            rows = rows[rows != exclude]
+        scores = (self.vectors[rows] @ vector.T).toarray().ravel()
+        best = np.argsort(-scores, kind="stable")[:k]
+        return pd.Series(
+            scores[best], index=self.index[rows[best]], name="similarity"
+        )
+
+    def similar(self, label, k=10):
+        """Find the most similar narratives to an indexed narrative."""
+        row = self.index.get_loc(label)
+        return self.query(self.vectors[row], k=k, exclude=row)
+
+    def similar_text(self, text, k=10):
+        """Find the most similar narratives to a new narrative string."""
+        vector = self.embedder.transform([text]).astype(np.float32)
+        return self.query(vector, k=k)
+
+
+def similar_accidents(index, row_id, k=10, accident_df=None):
+    """
+    Find the accidents with the most similar narratives to an accident.
+
+    Parameters
+    ----------
+    index
+        A SimilarityIndex of the accident narratives.
+    row_id
+        The index label of the accident.
+    k
+        The number of similar accidents to return.
+    accident_df
+        If given, the similar accidents' rows are joined to the results.
+
+    Returns
+    -------
+    A dataframe indexed by accident with a similarity column, most
+    similar first.
+    """
+    out = index.similar(row_id, k=k).to_frame()
+    if accident_df is not None:
+        out = out.join(accident_df)
+    return out
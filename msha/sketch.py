@@ -0,0 +1,189 @@
+"""
+Mergeable quantile sketches for bounded-memory descriptive stats.
+"""
+import numpy as np
+import pandas as pd
+
+
+class TDigest:
+    """
+    A merging t-digest for estimating quantiles of a stream of values.
+
+    Values are buffered then compressed into at most about compression / 2
+    weighted centroids, which are small near the tails (using the k1 scale
+    function) so extreme quantiles stay accurate. Digests built from
+    different chunks or partitions of the data can be merged.
+
+    Parameters
+    ----------
+    compression
+        Controls the number of centroids and hence the accuracy and memory.
+    """
+
+    def __init__(self, compression=200):
+        self.compression = compression
+        self.count = 0
+        self.total = 0.0
+        self.total_squared = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+        self._means = np.empty(0)
+        self._weights = np.empty(0)
+        self._buffer = []
+        self._buffered = 0
+
+    def update(self, values):
+        """Add an array of values to the digest, nans are ignored."""
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return self
+        self.count += len(values)
+        self.total += values.sum()
+        self.total_squared += np.square(values).sum()
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+        self._buffer.append(values)
+        self._buffered += len(values)
+        if self._buffered > 5 * self.compression:
+            self._compress()
+        return self
+
+    def merge(self, other):
+        """Return a new digest which summarizes the values of both digests."""
+        out = TDigest(compression=max(self.compression, other.compression))
+        for digest in (self, other):
+            digest._compress()
+            out.count += digest.count
+            out.total += digest.total
+            out.total_squared += digest.total_squared
+            out.min = min(out.min, digest.min)
+            out.max = max(out.max, digest.max)
+        out._means = np.concatenate([self._means, other._means])
+        out._weights = np.concatenate([self._weights, other._weights])
+        out._compress(force=True)
+        return out
+
+    __add__ = merge
+
+    def _compress(self, force=False):
+        """Merge the buffer and centroids into a new set of centroids."""
+        if not self._buffered and not force:
+            return
+        buffered = [np.ones(len(x)) for x in self._buffer]
+        means = np.concatenate([self._means] + self._buffer)
+        weights = np.concatenate([self._weights] + buffered)
+        self._buffer, self._buffered = [], 0
+        if not len(means):
+            return
+        # break ties by weight so merges don't depend on the order of digests
+        order = np.lexsort((weights, means))
+        means, weights = means[order], weights[order]
+        # each centroid spans less than one unit of the k1 scale function
+        cum_weight = np.cumsum(weights)
+        quantile = (cum_weight - weights / 2) / cum_weight[-1]
+        scale = self.compression / (2 * np.pi) * np.arcsin(2 * quantile - 1)
+        cluster = np.floor(scale - scale[0]).astype(np.int64)
+        new_weights = np.bincount(cluster, weights=weights)
+        new_sums = np.bincount(cluster, weights=weights * means)
+        has_weight = new_weights > 0
+        self._weights = new_weights[has_weight]
+        self._means = new_sums[has_weight] / self._weights
+
+    def quantile(self, q):
+        """Estimate the quantile(s) q, which must be between 0 and 1."""
+        self._compress()
+        q = np.asarray(q, dtype=np.float64)
+        if not self.count:
+            return np.full(q.shape, np.nan)[()]
+        # interpolate between centroid centers, anchored by the min and max
+        centers = np.cumsum(self._weights) - self._weights / 2
+        ranks = np.concatenate([[0], centers, [self.count]])
+        values = np.concatenate([[self.min], self._means, [self.max]])
+        return np.interp(q * self.count, ranks, values)[()]
+
+    @property
+    def mean(self):
+        """The mean of the values."""
+        return self.total / self.count if self.count else np.nan
+
+    @property
+    def std(self):
+        """The sample standard deviation of the values."""
+        if self.count < 2:
+            return np.nan
+        sum_squares = self.total_squared - self.total ** 2 / self.count
+        return np.sqrt(max(sum_squares, 0) / (self.count - 1))
+
+    def __len__(self):
+        return len(self._means) + self._buffered
+
+    def __repr__(self):
+        return f"TDigest(count={self.count}, centroids={len(self)})"
+
+
+def sketch_by_period(df, columns, freq="q", sketches=None, compression=200):
+    """
+    Update quantile sketches of columns for each period with the rows of df.
+
+    Can be called on chunks of a dataframe, passing the output of the
+    previous call as sketches, to stream data with bounded memory.
+
+    Parameters
+    ----------
+    df
+        A dataframe with a date column and the columns to sketch.
+    columns
+        The names of the columns to sketch.
+    freq
+        The frequency of the periods.
+    sketches
+        The output of a previous call, updated in place.
+    compression
+        The compression of new digests.
+
+    Returns
+    -------
+    A dict of {column: {period: TDigest}}.
+    """
+    sketches = {} if sketches is None else sketches
+    grouper = pd.Grouper(key="date", freq=freq)
+    for period, sub in df.groupby(grouper):
+        if not len(sub):
+            continue
+        for column in columns:
+            period_sketches = sketches.setdefault(column, {})
+            if period not in period_sketches:
+                period_sketches[period] = TDigest(compression=compression)
+            period_sketches[period].update(sub[column].values)
+    return sketches
+
+
+def merge_sketches(*sketch_dicts):
+    """Merge the outputs of sketch_by_period from several partitions."""
+    out = {}
+    for sketches in sketch_dicts:
+        for column, period_sketches in sketches.items():
+            merged = out.setdefault(column, {})
+            for period, digest in period_sketches.items():
+                current = merged.get(period)
+                merged[period] = digest if current is None else current + digest
+    return out
+
+
+def describe_sketches(period_sketches, percentiles=(0.25, 0.5, 0.75)):
+    """
+    Create a dataframe like DataFrame.describe from a dict of {period: TDigest}.
+    """
+    labels = [f"{x * 100:g}%" for x in percentiles]
+    rows = {}
+    for period, digest in period_sketches.items():
+        row = dict(count=digest.count, mean=digest.mean, std=digest.std)
+        row["min"] = digest.min if digest.count else np.nan
+        row.update(zip(labels, np.atleast_1d(digest.quantile(percentiles))))
+        row["max"] = digest.max if digest.count else np.nan
+        rows[period] = row
+    columns = ["count", "mean", "std", "min"] + labels + ["max"]
+    out = pd.DataFrame.from_dict(rows, orient="index", columns=columns)
+    out.index.name = "date"
+    return out.sort_index()
@@ -0,0 +1,192 @@
+"""
+Typo tolerant normalization of narratives with a symmetric delete dictionary.
+"""
+import re
+from collections import Counter
+from functools import lru_cache
+from itertools import combinations
+
+import pandas as pd
+
+from msha.constants import BURST_VOCABULARY
+
+# tokens which are considered for correction
+WORD_REGEX = re.compile(r"[a-z0-9]+")
+
+# inflectional suffixes stripped by stem, longest first
+SUFFIXES = ("ings", "ing", "ers", "er", "ed", "es", "s", "e")
+
+
+def edit_distance(first, second):
+    """
+    Return the optimal string alignment distance between two strings.
+
+    This is the Levenshtein distance where swapping two adjacent characters
+    also counts as one edit.
+    """
+    rows = [list(range(len(second) + 1))]
+    for i, char1 in enumerate(first, 1):
+        row = [i] + [0] * len(second)
+        for j, char2 in enumerate(second, 1):
+            cost = char1 != char2
+            row[j] = min(rows[-1][j] + 1, row[j - 1] + 1, rows[-1][j - 1] + cost)
+            swapped = i > 1 and j > 1 and char1 == second[j - 2]
+            if swapped and first[i - 2] == char2:
+                row[j] = min(row[j], rows[-2][j - 2] + 1)
+        rows.append(row)
+    return rows[-1][-1]
+
+
+def _deletes(word, distance):
+    """Return the set of strings made by deleting up to distance characters."""
+    out = {word}
+    for num in range(1, min(distance, len(word)) + 1):
+        for drop in combinations(range(len(word)), num):
+            out.add("".join(x for i, x in enumerate(word) if i not in drop))
+    return out
+
+
+def max_distance_for(token):
+    """The number of edits allowed for a token, short tokens aren't corrected."""
+    if len(token) < 5:
+        return 0
+    return 1 if len(token) < 8 else 2
+
+
+class SymSpell:
+    """
+    A symmetric delete spelling corrector for a small vocabulary.
+
+    The deletes of each word are precomputed so a lookup only generates the
+    deletes of the token and checks them in a dictionary, rather than
+    comparing the token with every word.
+
+    Parameters
+    ----------
+    words
+        The correctly spelled words.
+    max_distance
+        The largest number of edits which are corrected.
+    """
+
+    def __init__(self, words, max_distance=2):
+        self.words = frozenset(words)
+        self.max_distance = max_distance
+        self._deletes = {}
+        for word in sorted(self.words):
+            for delete in _deletes(word, max_distance):
+                self._deletes.setdefault(delete, []).append(word)
+
+    def lookup(self, token, max_distance=None):
+        """
+        Return the closest word to token, or None if none are close enough.
+
+        Ties are broken alphabetically so lookups are deterministic.
+        """
+        if token in self.words:
+            return token
+        if max_distance is None:
+            max_distance = self.max_distance
+        max_distance = min(max_distance, self.max_distance)
+        if max_distance < 1:
+            return None
+        candidates = set()
+        for delete in _deletes(token, max_distance):
+            candidates.update(self._deletes.get(delete, ()))
+        scored = sorted((edit_distance(token, x), x) for x in candidates)
+        if scored and scored[0][0] <= max_distance:
+            return scored[0][1]
+        return None
+
+
+def stem(token):
+    """
+    Strip an inflectional suffix from a token, eg "bounded" and "bounds"
+    become "bound". Stems keep at least three characters.
+    """
+    for suffix in SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= 3:
+            return token[: -len(suffix)]
+    return token
+
+
+@lru_cache(maxsize=None)
+def get_corrector(words=BURST_VOCABULARY, max_distance=2):
+    """Return a SymSpell for the burst vocabulary, built only once."""
+    return SymSpell(words, max_distance=max_distance)
+
+
+def find_corrections(narratives, corrector=None, min_ratio=20):
+    """
+    Find the corrections of the misspelled tokens in narratives.
+
+    A token is only corrected if its correction is at least min_ratio times
+    more common in the narratives, so rare typos like "olutburst" are
+    corrected but real words like "flood" (one edit from "floor") are not.
+    The narratives also serve as the dictionary of real words: a token is
+    not a typo if another inflection of it is used (eg "bounded" isn't
+    corrected to "bounced" if "bound" or "bounds" occurs), or if it is an
+    inflection of its correction ("bumper" and "pillars" aren't typos of
+    "bumped" and "pillar"). Typos rarely change the first letter so tokens
+    like "jumped" are never corrected ("bumped").
+
+    Returns
+    -------
+    A dict of {token: correction}.
+    """
+    corrector = get_corrector() if corrector is None else corrector
+    counts = Counter()
+    for text in narratives:
+        counts.update(WORD_REGEX.findall(text.lower()))
+    # the number of distinct tokens of each stem
+    stem_forms = Counter(stem(x) for x in counts)
+    out = {}
+    for token, count in counts.items():
+        correction = corrector.lookup(token, max_distance_for(token))
+        if correction is None or correction == token:
+            continue
+        if correction[0] != token[0] or stem(token) == stem(correction):
+            continue
+        if token.startswith(correction) or stem_forms[stem(token)] > 1:
+            continue
+        if counts.get(correction, 0) >= min_ratio * count:
+            out[token] = correction
+    return out
+
+
+def correct_narratives(narratives, corrections=None, corrector=None, min_ratio=20):
+    """
+    Correct misspelled burst terms in a series of narratives.
+
+    Parameters
+    ----------
+    narratives
+        A series of narrative strings.
+    corrections
+        A dict of {token: correction}, if None find_corrections is used.
+    corrector
+        The SymSpell used by find_corrections, defaults to get_corrector().
+    min_ratio
+        See find_corrections.
+
+    Returns
+    -------
+    A series of narratives with the misspelled tokens replaced by their
+    (lower case) corrections.
+    """
+    narratives = narratives.fillna("").astype(str)
+    if corrections is None:
+        corrections = find_corrections(narratives.values, corrector, min_ratio)
+    if not corrections:
+        return narratives
+    words = sorted(corrections, key=len, reverse=True)
+    regex = re.compile(r"\b(" + "|".join(map(re.escape, words)) + r")\b", re.I)
+
+    def _replace(match):
+        return corrections[match.group(0).lower()]
+
+    return pd.Series(
+        [regex.sub(_replace, x) for x in narratives.values],
+        index=narratives.index,
+        name=narratives.name,
+    )
@@ -0,0 +1,157 @@
+"""
+Text normalization, hashed features and phrase mining for accident narratives.
+"""
+import re
+
+import numpy as np
+import pandas as pd
+from sklearn.feature_extraction.text import CountVectorizer, HashingVectorizer
+
+# The default number of hashed features (columns of the sparse matrices)
+N_FEATURES = 2 ** 20
+
+
+def normalize_text(text):
+    """Lower case a string and collapse all whitespace to single spaces."""
+    if not isinstance(text, str):
+        return ""
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+# Words which carry no information when matching mine and company names
+NAME_STOP_WORDS = (
+    "AND",
+    "CO",
+    "COMPANY",
+    "CORP",
+    "CORPORATION",
+    "INC",
+    "INCORPORATED",
+    "LLC",
+    "LTD",
+    "MINE",
+    "MINES",
+    "NO",
+    "NOS",
+    "NUMBER",
+    "OF",
+    "THE",
+)
+
+
+def normalize_name(names):
+    """
+    Normalize a series of mine or company names for matching.
+
+    Names are upper cased, "#" is treated as "NO", punctuation and
+    NAME_STOP_WORDS are removed, so "Sunnyside No. 1 Mine" and
+    "SUNNYSIDE #1" both become "SUNNYSIDE 1".
+    """
+    names = pd.Series(names, dtype=object).fillna("").astype(str).str.upper()
+    names = names.str.replace("#", " NO ", regex=False)
+    names = names.str.replace(r"[^A-Z0-9]+", " ", regex=True)
+    stop_words = r"\b(?:" + "|".join(NAME_STOP_WORDS) + r")\b"
+    names = names.str.replace(stop_words, " ", regex=True)
+    return names.str.split().str.join(" ")
+
+
+def make_hashing_vectorizer(n_features=N_FEATURES, ngram_range=(1, 2), norm="l2"):
+    """
+    Create a stateless vectorizer which hashes narrative n-grams.
+
+    Parameters
+    ----------
+    n_features
+        The number of hashed features.
+    ngram_range
+        The smallest and largest word n-grams to use.
+    norm
+        The norm used to scale each row, or None.
+    """
+    return HashingVectorizer(
+        n_features=n_features,
+        ngram_range=ngram_range,
+        preprocessor=normalize_text,
+        alternate_sign=False,
+        norm=norm,
+    )
+
+
+def hash_narratives(narratives, **kwargs):
+    """
+    Return a sparse matrix of hashed n-gram features, one row per narrative.
+
+    kwargs are passed to make_hashing_vectorizer.
+    """
+    vectorizer = make_hashing_vectorizer(**kwargs)
+    return vectorizer.transform(narratives.fillna("").astype(str).values)
+
+
+def discriminative_phrases(
+    narratives,
+    labels,
+    ngram_range=(1, 3),
+    min_count=3,
+    strict=True,
+    chunk_size=50_000,
+):
+    """
+    Rank the word n-grams which discriminate labeled narratives from the rest.
+
+    The vocabulary is only built from the positive narratives, which are
+    few, then the other narratives are counted against it in chunks as
+    sparse binary matrices, so memory does not grow with the n-grams of the
+    whole corpus.
+
+    Parameters
+    ----------
+    narratives
+        A series of narrative strings.
+    labels
+        A bool array indicating the positive (eg burst) narratives.
+    ngram_range
+        The smallest and largest word n-grams to count.
+    min_count
+        The minimum number of positive narratives a phrase must occur in.
+    strict
+        If True only return phrases which never occur in other narratives.
+    chunk_size
+        The number of other narratives counted at once.
+
+    Returns
+    -------
+    A dataframe indexed by phrase with the number of positive and other
+    narratives each occurs in, the fraction of its narratives which are
+    positive and its smoothed log odds ratio, best first.
+    """
+    narratives = pd.Series(narratives).fillna("").astype(str).values
+    labels = np.asarray(labels, dtype=bool)
+    vectorizer = CountVectorizer(
+        ngram_range=ngram_range,
+        preprocessor=normalize_text,
+        binary=True,
+        min_df=min_count,
+    )
+    positive = vectorizer.fit_transform(narratives[labels])
+    positive_counts = np.asarray(positive.sum(axis=0)).ravel()
+    other_counts = np.zeros_like(positive_counts)
+    others = narratives[~labels]
+    for start in range(0, len(others), chunk_size):
+        chunk = vectorizer.transform(others[start : start + chunk_size])
+        other_counts += np.asarray(chunk.sum(axis=0)).ravel()
+    n_positive, n_other = labels.sum(), len(others)
+    log_odds = np.log(
+        (positive_counts + 0.5) / (n_positive - positive_counts + 0.5)
+    ) - np.log((other_counts + 0.5) / (n_other - other_counts + 0.5))
+    out = pd.DataFrame(
+        {
+            "positive_count": positive_counts,
+            "other_count": other_counts,
+            "precision": positive_counts / (positive_counts + other_counts),
+            "log_odds": log_odds,
+        },
+        index=pd.Index(vectorizer.get_feature_names_out(), name="phrase"),
+    )
+    if strict:
+        out = out[out["other_count"] == 0]
+    return out.sort_values(["log_odds", "positive_count"], ascending=False)
@@ -0,0 +1,146 @@
+"""
+Streaming clustering of accident narratives into mechanism topics.
+"""
+import numpy as np
+import pandas as pd
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.feature_extraction.text import CountVectorizer
+from sklearn.preprocessing import normalize
+
+from msha.text import make_hashing_vectorizer, normalize_text
+
+
+def _batches(narratives, batch_size):
+    """Yield batches of narrative strings."""
+    texts = narratives.fillna("").astype(str).values
+    for start in range(0, len(texts), batch_size):
+        yield texts[start : start + batch_size]
+
+
+class NarrativeClusters:
+    """
+    Mini-batch k-means clusters of tf-idf weighted hashed narrative n-grams.
+
+    The corpus is streamed in batches; once to count document frequencies
+    and once to fit the clusters, so only a batch of feature rows is in
+    memory at a time.
+
+    Parameters
+    ----------
+    n_clusters
+        The number of clusters, at most 127 so labels fit in an int8.
+    n_features
+        The number of hashed features.
+    ngram_range
+        The smallest and largest word n-grams to use.
+    batch_size
+        The number of narratives in each batch, at least n_clusters.
+    random_state
+        The random seed of the k-means initialization.
+    """
+
+    def __init__(
+        self,
+        n_clusters=12,
+        n_features=2 ** 18,
+        ngram_range=(1, 2),
+        batch_size=4096,
+        random_state=42,
+    ):
+        if not 0 < n_clusters < 128:
+            raise ValueError("n_clusters must be between 1 and 127")
+        if batch_size < n_clusters:
+            raise ValueError("batch_size must be at least n_clusters")
+        self.n_clusters = n_clusters
+        self.batch_size = batch_size
+        self.vectorizer = make_hashing_vectorizer(
+            n_features=n_features, ngram_range=ngram_range, norm=None
+        )
+        self.kmeans = MiniBatchKMeans(
+            n_clusters=n_clusters,
+            batch_size=batch_size,
+            random_state=random_state,
+            n_init=3,
+        )
+        self.idf = None
+
+    def transform(self, texts):
+        """Return the l2 normalized tf-idf features of an array of strings."""
+        counts = self.vectorizer.transform(texts)
+        counts.data = np.log1p(counts.data)
+        return normalize(counts.multiply(self.idf).tocsr())
+
+    def fit(self, narratives):
+        """Fit the clusters to a series of narratives."""
+        if len(narratives) < self.n_clusters:
+            msg = f"can't fit {self.n_clusters} clusters to {len(narratives)} rows"
+            raise ValueError(msg)
+        doc_freq = np.zeros(self.vectorizer.n_features)
+        for texts in _batches(narratives, self.batch_size):
+            counts = self.vectorizer.transform(texts)
+            doc_freq += np.bincount(counts.indices, minlength=len(doc_freq))
+        n_docs = len(narratives)
+        self.idf = np.log((1 + n_docs) / (1 + doc_freq)) + 1
+        # k-means needs n_clusters samples to start, which the first batch
+        # has, then later batches can be smaller
+        for texts in _batches(narratives, self.batch_size):
+            self.kmeans.partial_fit(self.transform(texts))
+        return self
+
+    def predict(self, narratives):
+        """Return an int8 array of the cluster of each narrative."""
+        labels = [
+            self.kmeans.predict(self.transform(texts))
+            for texts in _batches(narratives, self.batch_size)
+        ]
+        return np.concatenate(labels or [[]]).astype(np.int8)
+
+    def top_terms(self, narratives, n_terms=10):
+        """
+        Return the highest weighted terms of each cluster.
+
+        Hashed features can't be mapped back to terms, so the n-grams of
+        narratives (eg a sample of the corpus) are hashed to look them up.
+
+        Returns
+        -------
+        A dataframe indexed by cluster with a column for each term rank.
+        """
+        low, high = self.vectorizer.ngram_range
+        vocab = CountVectorizer(ngram_range=(low, high), preprocessor=normalize_text)
+        vocab.fit(narratives.fillna("").astype(str).values)
+        terms = vocab.get_feature_names_out()
+        # hash the terms of each length as single n-grams to get their columns
+        lengths = np.array([len(x.split()) for x in terms])
+        columns = np.empty(len(terms), dtype=np.int64)
+        for length in range(low, high + 1):
+            is_length = lengths == length
+            vectorizer = make_hashing_vectorizer(
+                n_features=self.vectorizer.n_features,
+                ngram_range=(length, length),
+                norm=None,
+            )
+            columns[is_length] = vectorizer.transform(terms[is_length]).indices
+        weights = self.kmeans.cluster_centers_[:, columns]
+        best = np.argsort(-weights, axis=1)[:, :n_terms]
+        return pd.DataFrame(terms[best]).rename_axis("cluster")
+
+
+def cluster_narratives(df, model=None, column="narrative_cluster", **kwargs):
+    """
+    Add a compact int8 column with the narrative cluster of each row.
+
+    Parameters
+    ----------
+    df
+        A dataframe with a narrative column.
+    model
+        A fitted NarrativeClusters, if None one is fit to df's narratives.
+    column
+        The name of the new column.
+
+    kwargs are passed to NarrativeClusters.
+    """
+    if model is None:
+        model = NarrativeClusters(**kwargs).fit(df["narrative"])
+    return df.assign(**{column: model.predict(df["narrative"])})
@@ -0,0 +1,60 @@
+"""
+Tests for the incrementally updated quarterly aggregates.
+"""
+import pandas as pd
+import pytest
+
+from msha.aggregates import QuarterlyAggregates
+from msha.core import normalize_injuries
+
+QUARTER = pd.offsets.QuarterEnd()
+
+
+@pytest.fixture
+def accidents():
+    dates = ["2000-01-10", "2000-02-03", "2000-05-06", "2000-05-07", "2000-08-01"]
+    days_away = "DAYS AWAY FROM WORK ONLY"
+    degrees = ["FATALITY", "ACCIDENT ONLY", days_away, "FATALITY", days_away]
+    return pd.DataFrame(
+        {
+            "date": pd.to_datetime(dates),
+            "mine_id": [1, 1, 2, 1, 2],
+            "degree_injury": degrees,
+        }
+    )
+
+
+@pytest.fixture
+def production():
+    return pd.DataFrame(
+        {
+            "date": pd.to_datetime(["2000-01-01", "2000-01-01", "2000-04-01"]),
+            "mine_id": [1, 2, 1],
+            "hours_worked": [1000.0, 500.0, 2000.0],
+            "employee_count": [10, 5, 12],
+            "coal_production": [100.0, 50.0, 300.0],
+        }
+    )
+
+
+def _assert_matches_core(aggs, accidents, production):
+    expected = normalize_injuries(accidents, production, freq=QUARTER)
+    got = aggs.normalize_injuries()
+    pd.testing.assert_frame_equal(
+        got, expected, check_dtype=False, check_freq=False, check_names=False
+    )
+
+
+def test_full_build_matches_core(accidents, production):
+    aggs = QuarterlyAggregates.from_frames(accidents, production, freq=QUARTER)
+    _assert_matches_core(aggs, accidents, production)
+
+
+def test_new_quarter_without_production_matches_core(accidents, production):
+    # the third quarter's accidents arrive before its production
+    old = accidents["date"] < "2000-07-01"
+    aggs = QuarterlyAggregates.from_frames(accidents[old], production, freq=QUARTER)
+    aggs.update(accident_df=accidents[~old])
+    normed = aggs.normalize_injuries()
+    assert normed.loc["2000-09-30"].isnull().all()
+    _assert_matches_core(aggs, accidents, production)
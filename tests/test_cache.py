@@ -0,0 +1,82 @@
+"""
+Tests for caching burst classifications between runs.
+"""
+import pandas as pd
+import pytest
+import spacy
+
+import msha.core
+from msha.core import burst_rule_counts, burst_rules_fingerprint, classify_bursts
+from msha.profiling import StageTimer
+
+NARRATIVES = pd.Series(
+    [
+        "A coal bump occurred on the longwall face.",
+        "A bounce threw the employee against the shuttle car.",
+        "Employee slipped on ice.",
+        "Employee slipped on ice.",
+    ]
+)
+
+
+@pytest.fixture
+def classified(monkeypatch):
+    """Record the number of narratives classified (not read from the cache)."""
+    # a blank pipeline parses without the full model, the rules never hit
+    monkeypatch.setattr(msha.core, "get_nlp", lambda: spacy.blank("en"))
+    counts = []
+    classify = msha.core._classify_preprocessed
+
+    def _classify_preprocessed(preproc, *args, **kwargs):
+        counts.append(len(preproc))
+        return classify(preproc, *args, **kwargs)
+
+    monkeypatch.setattr(msha.core, "_classify_preprocessed", _classify_preprocessed)
+    return counts
+
+
+def test_second_run_hits_cache(tmp_path, classified):
+    path = tmp_path / "cache.sqlite"
+    first = classify_bursts(NARRATIVES, cache_path=path)
+    second = classify_bursts(NARRATIVES, cache_path=path)
+    assert first.tolist() == second.tolist() == [True, False, False, False]
+    # repeated narratives are classified once, then nothing is reclassified
+    assert classified == [3, 0]
+
+
+def test_new_narratives_are_classified(tmp_path, classified):
+    path = tmp_path / "cache.sqlite"
+    classify_bursts(NARRATIVES, cache_path=path)
+    more = pd.concat([NARRATIVES, pd.Series(["An outburst of coal."])])
+    out = classify_bursts(more, cache_path=path)
+    assert out.tolist() == [True, False, False, False, True]
+    assert classified == [3, 1]
+
+
+def test_changed_rules_invalidate_cache(tmp_path, classified, monkeypatch):
+    path = tmp_path / "cache.sqlite"
+    classify_bursts(NARRATIVES, cache_path=path)
+    fingerprint = burst_rules_fingerprint()
+    version = msha.core.BURST_RULES_VERSION + 1
+    monkeypatch.setattr(msha.core, "BURST_RULES_VERSION", version)
+    assert burst_rules_fingerprint() != fingerprint
+    classify_bursts(NARRATIVES, cache_path=path)
+    assert classified == [3, 3]
+
+
+def test_cached_rows_keep_their_rule(tmp_path, classified):
+    path = tmp_path / "cache.sqlite"
+    first = classify_bursts(NARRATIVES, cache_path=path, explain=True)
+    second = classify_bursts(NARRATIVES, cache_path=path, explain=True)
+    assert first["rule"].tolist() == second["rule"].tolist()
+    assert first["rule"].tolist() == ["strict", "none", "none", "none"]
+    assert not first["is_cached"].any() and second["is_cached"].all()
+    pd.testing.assert_frame_equal(burst_rule_counts(first), burst_rule_counts(second))
+
+
+def test_parse_timed_per_batch(classified):
+    narratives = pd.Series([f"A bounce threw employee {x}." for x in range(5)])
+    timer = StageTimer()
+    classify_bursts(narratives, batch_size=2, timer=timer)
+    assert len(timer.latencies["parse"]) == 3
+    assert len(timer.latencies["rules"]) == 1
@@ -0,0 +1,55 @@
+"""
+Tests for the linear burst classifier.
+"""
+import os
+
+import pandas as pd
+import pytest
+
+from msha.classifier import get_training_data, load_burst_model, save_burst_model
+
+
+@pytest.fixture
+def accidents():
+    return pd.DataFrame(
+        {
+            "date": pd.to_datetime(["2010-01-05", "2010-02-01", "2010-03-01"]),
+            "mine_id": [1, 2, 3],
+            "narrative": [
+                "A bump threw coal from the rib.",
+                "Employee slipped on ice.",
+                "Roof fell on the shuttle car.",
+            ],
+        },
+        index=[10, 11, 12],
+    )
+
+
+@pytest.fixture
+def bumps():
+    return pd.DataFrame(
+        {
+            "date": ["2010-01-05", "2010-03-01"],
+            "mineid": ["1", "na"],
+            "narrative": ["notes: big bump at mine 1", "unrelated notes"],
+        }
+    )
+
+
+def test_training_positives_are_linked_accidents(accidents, bumps):
+    """Only accident narratives are used, positives are the linked ones."""
+    narratives, labels = get_training_data(accidents, bumps)
+    assert narratives.tolist() == accidents["narrative"].tolist()
+    assert labels.tolist() == [True, False, False]
+
+
+def test_load_retrained_model(tmp_path):
+    path = tmp_path / "model.pkl"
+    save_burst_model({"version": 1}, path)
+    assert load_burst_model(path) == {"version": 1}
+    assert load_burst_model(path) is load_burst_model(str(path))
+    save_burst_model({"version": 2}, path)
+    # make sure the modification time changes on coarse clock filesystems
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert load_burst_model(path) == {"version": 2}
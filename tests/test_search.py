@@ -0,0 +1,72 @@
+"""
+Tests for the narrative phrase search.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from msha.search import NarrativeIndex, search_narratives
+
+NARRATIVES = pd.Series(
+    [
+        "A coal bump occurred in the longwall face.",
+        "The roof fell; a coal bump was reported.",
+        "Employee slipped on ice.",
+        "Bump of coal from the rib.",
+    ],
+    index=[10, 11, 12, 13],
+)
+
+
+@pytest.fixture
+def index():
+    return NarrativeIndex.from_narratives(NARRATIVES)
+
+
+def test_search_phrase(index):
+    out = search_narratives(index, "coal bump")
+    assert out.tolist() == [True, True, False, False]
+    assert out.index.tolist() == NARRATIVES.index.tolist()
+
+
+def test_search_single_series_filter(index):
+    mask = pd.Series([True, False, True, True], index=NARRATIVES.index)
+    out = search_narratives(index, ["coal bump", "bump of coal"], filters=mask)
+    assert out.tolist() == [True, False, False, True]
+
+
+def test_search_single_array_filter(index):
+    mask = np.array([False, True, True, True])
+    out = search_narratives(index, "coal bump", filters=mask)
+    assert out.tolist() == [False, True, False, False]
+
+
+def test_search_filter_sequence(index):
+    masks = [np.array([True, True, False, True]), np.array([True, False, True, True])]
+    out = search_narratives(index, "bump", filters=masks)
+    assert out.tolist() == [True, False, False, True]
+
+
+def test_search_filter_wrong_length(index):
+    with pytest.raises(ValueError):
+        search_narratives(index, "bump", filters=np.array([True, False]))
+
+
+def test_search_filter_aligned_by_label(index):
+    mask = pd.Series([True, True, False, False], index=[13, 10, 12, 11])
+    out = search_narratives(index, ["coal bump", "bump of coal"], filters=mask)
+    assert out.tolist() == [True, False, False, True]
+
+
+def test_search_filter_missing_labels(index):
+    mask = pd.Series([True, True], index=[10, 11])
+    with pytest.raises(ValueError):
+        search_narratives(index, "bump", filters=mask)
+
+
+def test_index_round_trip(index, tmp_path):
+    path = tmp_path / "index.npz"
+    index.save(path)
+    loaded = NarrativeIndex.load(path)
+    assert loaded.phrase_rows("coal bump").tolist() == [0, 1]
+    assert loaded.index.tolist() == NARRATIVES.index.tolist()
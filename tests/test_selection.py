@@ -0,0 +1,68 @@
+"""
+Tests for the forward feature selection of select_k_best_regression.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.linear_model import LinearRegression
+from sklearn.metrics import mean_absolute_error
+from sklearn.model_selection import TimeSeriesSplit
+
+from msha.core import select_k_best_regression
+
+
+class SlowLinearRegression(LinearRegression):
+    """Plain OLS which select_k_best_regression fits for each candidate."""
+
+
+@pytest.fixture
+def features():
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame(rng.normal(size=(80, 8)), columns=list("abcdefgh"))
+    # collinear features so the QR updates have to handle dependence
+    df["i"] = df["a"] + df["b"]
+    target = 3 * df["c"] - 2 * df["e"] + df["i"] + rng.normal(size=len(df))
+    return df, target
+
+
+def brute_force_selection(feature_df, target, k, cv=None, **kwargs):
+    """Forward select by fitting an OLS regression for each candidate."""
+    X, y = feature_df.values, target.values
+    if cv is None:
+        splits = [(slice(None), slice(None))]
+    else:
+        splits = list(TimeSeriesSplit(n_splits=cv).split(X))
+    selected, scores = [], []
+    while len(selected) < k:
+        errors = {}
+        for column in range(X.shape[1]):
+            if column in selected:
+                continue
+            cols = selected + [column]
+            fold_errors = []
+            for train, test in splits:
+                model = LinearRegression(**kwargs).fit(X[train][:, cols], y[train])
+                pred = model.predict(X[test][:, cols])
+                fold_errors.append(mean_absolute_error(y[test], pred))
+            errors[column] = np.mean(fold_errors)
+        best = min(errors, key=errors.get)
+        selected.append(best)
+        scores.append(errors[best])
+    return list(feature_df.columns[selected]), scores
+
+
+@pytest.mark.parametrize("cv", [None, 4])
+@pytest.mark.parametrize("fit_intercept", [True, False])
+def test_qr_path_matches_brute_force(features, cv, fit_intercept):
+    df, target = features
+    kwargs = dict(k=4, cv=cv, return_scores=True, fit_intercept=fit_intercept)
+    fast, fast_scores = select_k_best_regression(df, target, **kwargs)
+    slow, slow_scores = select_k_best_regression(
+        df, target, regressor=SlowLinearRegression, **kwargs
+    )
+    expected, expected_scores = brute_force_selection(
+        df, target, 4, cv=cv, fit_intercept=fit_intercept
+    )
+    assert list(fast.columns) == list(slow.columns) == expected
+    np.testing.assert_allclose(fast_scores.values, expected_scores)
+    np.testing.assert_allclose(slow_scores.values, expected_scores)
@@ -0,0 +1,95 @@
+"""
+Tests for the micro-batching classification service.
+"""
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+from msha.service import make_server
+
+MAX_BATCH_SIZE = 4
+
+
+def classify(texts):
+    """Classify narratives mentioning a bump, fail or stall on request."""
+    if "fail" in texts:
+        raise RuntimeError("cannot classify")
+    if "stall" in texts:
+        time.sleep(1)
+    classify.batches.append(len(texts))
+    return ["bump" in x for x in texts]
+
+
+@pytest.fixture
+def server():
+    classify.batches = []
+    server = make_server(
+        warm=False,
+        timeout=0.5,
+        classify=classify,
+        max_batch_size=MAX_BATCH_SIZE,
+        max_wait=0.05,
+    )
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    server.batcher.close()
+
+
+def request(server, path, body=None):
+    """Return the status and JSON response of a request to the server."""
+    url = f"http://127.0.0.1:{server.server_port}{path}"
+    data = None if body is None else body.encode("utf8")
+    try:
+        with urllib.request.urlopen(url, data=data, timeout=5) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def test_classify_batch(server):
+    """A batch is classified in order, coalesced into full batches."""
+    narratives = ["a coal bump", "a roof fall", "a bump", "a rib roll", "bump"]
+    status, out = request(server, "/classify", json.dumps({"narratives": narratives}))
+    assert status == 200
+    assert out == {"bursts": [True, False, True, False, True]}
+    assert classify.batches == [MAX_BATCH_SIZE, 1]
+    status, out = request(server, "/classify", json.dumps({"narrative": "a bump"}))
+    assert (status, out) == (200, {"burst": True})
+    status, metrics = request(server, "/metrics")
+    assert status == 200
+    assert metrics["completed"] == 6
+    assert metrics["mean_batch_size"] == pytest.approx(2)
+
+
+@pytest.mark.parametrize(
+    "body",
+    ["not json", "[]", '{"narrative": 1}', '{"narratives": "a bump"}'],
+)
+def test_bad_request(server, body):
+    status, out = request(server, "/classify", body)
+    assert status == 400
+    assert out["error"].startswith("bad request")
+    assert classify.batches == []
+
+
+def test_classifier_error(server):
+    status, out = request(server, "/classify", json.dumps({"narrative": "fail"}))
+    assert status == 500
+    assert "cannot classify" in out["error"]
+
+
+def test_timeout(server):
+    status, out = request(server, "/classify", json.dumps({"narrative": "stall"}))
+    assert status == 504
+    assert out == {"error": "classification timed out"}
+
+
+def test_unknown_path(server):
+    assert request(server, "/nothing")[0] == 404
@@ -0,0 +1,61 @@
+"""
+Tests for the mergeable quantile sketches.
+"""
+from itertools import permutations
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from msha.sketch import TDigest, describe_sketches, merge_sketches, sketch_by_period
+
+QUARTER = pd.offsets.QuarterEnd()
+PERCENTILES = (0.01, 0.25, 0.5, 0.75, 0.99)
+
+
+@pytest.fixture
+def parts():
+    rng = np.random.default_rng(0)
+    return [rng.gamma(2, 5, size=size) for size in (3000, 500, 1700)]
+
+
+def test_merge_is_commutative(parts):
+    """Swapping two digests gives identical centroids, even with ties."""
+    first, second = (TDigest().update(np.round(x)) for x in parts[:2])
+    forward, backward = first + second, second + first
+    np.testing.assert_array_equal(forward._means, backward._means)
+    np.testing.assert_array_equal(forward._weights, backward._weights)
+
+
+def test_merge_order_independent(parts):
+    """Merging partitions in any order gives the same stats and quantiles."""
+    values = np.concatenate(parts)
+    expected = np.quantile(values, PERCENTILES)
+    spread = np.quantile(values, 0.99) - np.quantile(values, 0.01)
+    for order in permutations(parts):
+        digests = [TDigest().update(x) for x in order]
+        merged = (digests[0] + digests[1]) + digests[2]
+        assert merged.count == len(values)
+        assert merged.mean == pytest.approx(values.mean())
+        assert merged.std == pytest.approx(values.std(ddof=1))
+        assert (merged.min, merged.max) == (values.min(), values.max())
+        quantiles = merged.quantile(PERCENTILES)
+        np.testing.assert_allclose(quantiles, expected, atol=0.01 * spread)
+
+
+def test_merge_sketches_order_independent(parts):
+    """Merged period sketches describe the same as sketching all the rows."""
+    dates = pd.date_range("2000-01-01", "2001-12-31", periods=sum(map(len, parts)))
+    df = pd.DataFrame({"date": dates, "total_experience": np.concatenate(parts)})
+    chunks = [df.iloc[:1000], df.iloc[1000:3500], df.iloc[3500:]]
+    expected = describe_sketches(
+        sketch_by_period(df, ["total_experience"], QUARTER)["total_experience"]
+    )
+    for order in permutations(chunks):
+        sketches = [sketch_by_period(x, ["total_experience"], QUARTER) for x in order]
+        out = describe_sketches(merge_sketches(*sketches)["total_experience"])
+        pd.testing.assert_index_equal(out.index, expected.index)
+        np.testing.assert_array_equal(out["count"], expected["count"])
+        cols = ["mean", "std", "min", "max"]
+        np.testing.assert_allclose(out[cols], expected[cols])
+        np.testing.assert_allclose(out["50%"], expected["50%"], rtol=0.02)
@@ -0,0 +1,30 @@
+"""
+Tests for finding misspelled burst terms.
+"""
+from msha.spelling import find_corrections, stem
+
+# common burst terms, so their rare near misses are candidate typos
+CORPUS = ["the coal bumped out", "the rib bounced", "an outburst of coal"] * 30
+
+
+def test_stem():
+    assert stem("bounded") == stem("bounds") == stem("bound") == "bound"
+    assert stem("bumper") == stem("bumped") == "bump"
+
+
+def test_rare_typos_are_corrected():
+    out = find_corrections(CORPUS + ["an olutburst", "coal bumpde out"])
+    assert out == {"olutburst": "outburst", "bumpde": "bumped"}
+
+
+def test_inflections_of_the_correction_are_not_typos():
+    out = find_corrections(CORPUS + ["the bumper", "two pillars"])
+    assert out == {}
+
+
+def test_words_with_other_inflections_are_not_typos():
+    # "bounded" is a real word since "bound" is also used
+    out = find_corrections(CORPUS + ["area bounded by", "out of bound"])
+    assert out == {}
+    # without other inflections a rare near miss is taken to be a typo
+    assert find_corrections(CORPUS + ["area bounded by"]) == {"bounded": "bounced"}
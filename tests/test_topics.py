@@ -0,0 +1,35 @@
+"""
+Tests for the streaming narrative clusters.
+"""
+import pandas as pd
+import pytest
+
+from msha.topics import NarrativeClusters, cluster_narratives
+
+NARRATIVES = [
+    "coal bump threw the miner against the rib",
+    "rib rolled out and struck the miner",
+    "roof fall onto the shuttle car",
+    "slipped on ice in the parking lot",
+    "cut finger on a sharp edge",
+] * 3
+
+
+def test_small_final_batch():
+    """Batches smaller than n_clusters after the first are still fit."""
+    narratives = pd.Series(NARRATIVES)
+    model = NarrativeClusters(n_clusters=3, n_features=2 ** 10, batch_size=4)
+    labels = model.fit(narratives).predict(narratives)
+    assert len(labels) == len(narratives)
+    assert labels.max() < 3
+
+
+def test_too_few_narratives():
+    df = pd.DataFrame({"narrative": NARRATIVES[:2]})
+    with pytest.raises(ValueError, match="3 clusters to 2 rows"):
+        cluster_narratives(df, n_clusters=3)
+
+
+def test_batch_smaller_than_clusters():
+    with pytest.raises(ValueError, match="batch_size"):
+        NarrativeClusters(n_clusters=8, batch_size=4)